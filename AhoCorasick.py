@@ -20,7 +20,7 @@
 # defaultdict is used only for storing the final output
 # We will return a dictionary where key is the matched word
 # and value is the list of indexes of matched word
-from collections import defaultdict
+from collections import defaultdict, deque
 
 # Character representing wildcard.
 # ASSUMPTION: 1 wildcard per search word
@@ -35,19 +35,34 @@ class AhoCorasick:
         # Should be equal to the sum of the length of all keywords.
         self.max_states = sum([len(word) for word in words])
   
-        # Maximum number of characters.
-        # Currently supports only alphabets [a,z]
-        self.max_characters = 128
-  
-        # OUTPUT FUNCTION IS IMPLEMENTED USING out []
-        # Bit i in this mask is 1 if the word with
-        # index i appears when the machine enters this state.
-        # Lets say, a state outputs two words "he" and "she" and
-        # in our provided words list, he has index 0 and she has index 3
-        # so value of out[state] for this state will be 1001
-        # It has been initialized to all 0.
+        # Convert all words to lowercase
+        # so that our search is case insensitive
+        for i in range(len(words)):
+          words[i] = words[i].lower()
+
+        # Only the characters used by the words get a column in goto:
+        # alphabet maps each of them to 1, 2, ... and any other
+        # character of the text shares column 0.
+        self.alphabet = {}
+        for word in words:
+          for character in word:
+            if character not in self.alphabet:
+              self.alphabet[character] = len(self.alphabet)+1
+
+        # Number of columns, i.e. the alphabet plus column 0.
+        self.max_characters = len(self.alphabet)+1
+  
+        # OUTPUT FUNCTION IS IMPLEMENTED USING out [] AND dict_link []
+        # out[state] lists the indices of the words that end exactly
+        # at this state (most states have none).
+        # dict_link[state] is the nearest state on the failure chain
+        # of this state whose out list is not empty, or -1 if there is none.
+        # Lets say, a state outputs "she" and its failure state outputs "he";
+        # out[state] holds only "she" and dict_link[state] points at "he",
+        # so reporting a hit only visits the words that actually end there.
         # We have taken one extra state for the root.
-        self.out = [0]*(self.max_states+1)
+        self.out = [[] for _ in range(self.max_states+1)]
+        self.dict_link = [-1]*(self.max_states+1)
   
         # FAILURE FUNCTION IS IMPLEMENTED USING fail []
         # There is one value for each state + 1 for the root
@@ -57,18 +72,13 @@ class AhoCorasick:
   
         # GOTO FUNCTION (OR TRIE) IS IMPLEMENTED USING goto [[]]
         # Number of rows = max_states + 1
-        # Number of columns = max_characters i.e 26 in our case
+        # Number of columns = max_characters
         # It has been initialized to all -1.
         self.goto = [[-1]*self.max_characters for _ in range(self.max_states+1)]
-          
-        # Convert all words to lowercase
-        # so that our search is case insensitive
-        for i in range(len(words)):
-          words[i] = words[i].lower()
             
         # All the words in dictionary which will be used to create Trie
         # The index of each keyword is important:
-        # "out[state] & (1 << i)" is > 0 if we just found word[i]
+        # "i in out[state]" if we just found word[i]
         # in the text.
         self.words = words
         self.wildcard_words = []
@@ -147,10 +157,7 @@ class AhoCorasick:
   
             # Process all the characters of the current word
             for character in word:
-                ch = ord(character) - 97 # Ascii value of 'a' = 97
-
-                if character == '*':
-                    ch += 97
+                ch = self.alphabet[character]
   
                 # Allocate a new node (create a new state)
                 # if a node for ch doesn't exist.
@@ -161,7 +168,7 @@ class AhoCorasick:
                 current_state = self.goto[current_state][ch]
   
             # Add current word in output function
-            self.out[current_state] |= (1<<i)
+            self.out[current_state].append(i)
   
         # For all characters which don't have
         # an edge from root (or state 0) in Trie,
@@ -172,7 +179,8 @@ class AhoCorasick:
           
         # Failure function is computed in 
         # breadth first order using a queue
-        queue = []
+        # (a deque, so taking the front state is O(1))
+        queue = deque()
   
         # Iterate over every possible input
         for ch in range(self.max_characters):
@@ -189,7 +197,7 @@ class AhoCorasick:
         while queue:
   
             # Remove the front state from queue
-            state = queue.pop(0)
+            state = queue.popleft()
   
             # For the removed state, find failure
             # function for all those characters
@@ -211,8 +219,11 @@ class AhoCorasick:
                     failure = self.goto[failure][ch]
                     self.fail[self.goto[state][ch]] = failure
   
-                    # Merge output values
-                    self.out[self.goto[state][ch]] |= self.out[failure]
+                    # Link to the nearest suffix state that has outputs
+                    if self.out[failure]:
+                        self.dict_link[self.goto[state][ch]] = failure
+                    else:
+                        self.dict_link[self.goto[state][ch]] = self.dict_link[failure]
   
                     # Insert the next level node (of Trie) in Queue
                     queue.append(self.goto[state][ch])
@@ -227,7 +238,7 @@ class AhoCorasick:
     # next_input - The next character that enters into the machine.
     def __find_next_state(self, current_state, next_input):
         answer = current_state
-        ch = ord(next_input) - 97 # Ascii value of 'a' is 97
+        ch = self.alphabet.get(next_input, 0)
   
         # If goto is not defined, use
         # failure function
@@ -237,6 +248,17 @@ class AhoCorasick:
         return self.goto[answer][ch]
   
   
+    # Yields the index of every word that ends at the given state:
+    # first the words stored at the state itself, then the words of
+    # each state reached by following the dictionary suffix links.
+    def __matched_words(self, state):
+        if not self.out[state]:
+            state = self.dict_link[state]
+        while state != -1:
+            yield from self.out[state]
+            state = self.dict_link[state]
+  
+  
     # This function finds all occurrences of all words in text.
     def search_words(self, text):
         # Convert the text to lowercase to make search case insensitive
@@ -263,7 +285,7 @@ class AhoCorasick:
             current_state = self.__find_next_state(current_state, text[i])
   
             # If match not found, move to next state
-            if self.out[current_state] == 0: continue
+            if not self.out[current_state] and self.dict_link[current_state] == -1: continue
   
             # Match found, store the word in result dictionary
             # First check if this could be a wildcard substring match
@@ -271,65 +293,65 @@ class AhoCorasick:
 
 
 
-            for j in range(len(self.words)):
-                if (self.out[current_state] & (1<<j)) > 0:  # At this point in execution, we have confirmed that a match is found.
+            # In word index order, which the wildcard flags below rely on
+            for j in sorted(self.__matched_words(current_state)):  # At this point in execution, we have confirmed that a match is found.
 
-                    wordFound = True
-                    word = self.words[j]
+                wordFound = True
+                word = self.words[j]
 
-                    # for k in range(len(self.wildcard_substrings)):      # For debugging
-                    #     print(" = " + self.wildcard_substrings[k])      # For debugging
+                # for k in range(len(self.wildcard_substrings)):      # For debugging
+                #     print(" = " + self.wildcard_substrings[k])      # For debugging
 
-                    # Search if the found word is a wildcard substring
-                    for k in range(len(self.wildcard_substrings)):
-                        # print("> Looking at " + self.words[j] + " vs " + self.wildcard_substrings[k])
-                        if self.words[j] == self.wildcard_substrings[k]:
-                            print(">> Looking at " + self.words[j] + " vs " + self.wildcard_substrings[k])
-                            wordFound = False
-                            # If the latter portion of a wildcard string and it completes a word, set word as detected
-                            if wildCardPossibleFlag is True:
+                # Search if the found word is a wildcard substring
+                for k in range(len(self.wildcard_substrings)):
+                    # print("> Looking at " + self.words[j] + " vs " + self.wildcard_substrings[k])
+                    if self.words[j] == self.wildcard_substrings[k]:
+                        print(">> Looking at " + self.words[j] + " vs " + self.wildcard_substrings[k])
+                        wordFound = False
+                        # If the latter portion of a wildcard string and it completes a word, set word as detected
+                        if wildCardPossibleFlag is True:
                                 
-                                # print(self.wildcard_substring_indices[self.words[j]][0])
-                                # print(firstSubstringIndex[0])
-                                # distance = self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0]
-                                if self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0] == i-indexInText:
-                                    print(" -  LATTER IS " + self.words[j])
-                                    print("  - DIFF IN FIRST: " + str(self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0]))      # For debugging
-                                    print("  - DIFF IN SECOND: " + str(i-indexInText))
-                                    # print(" - WORD FOUND!")
-                                    word = text[indexInText:i+1]
-                                    wildCardPossibleFlag = False
-                                    firstSubstringIndex = -1
-                                    indexInText = -1
-                                    wordFound = True
-                                elif self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0] < i-indexInText:
-                                    print("   - Limit reached, wildcard word not possible")
-                                    word = text[indexInText:i+1]
-                                    wildCardPossibleFlag = False
-                                    firstSubstringIndex = -1
-                                    indexInText = -1
-                                    wordFound = False
-                            # If the former portion of a wildcard string, set flags and continue
-                            elif wildCardPossibleFlag is False:
-                                print(" -  FORMER IS " + self.words[j])      # For debugging
-                                wildCardPossibleFlag = True
+                            # print(self.wildcard_substring_indices[self.words[j]][0])
+                            # print(firstSubstringIndex[0])
+                            # distance = self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0]
+                            if self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0] == i-indexInText:
+                                print(" -  LATTER IS " + self.words[j])
+                                print("  - DIFF IN FIRST: " + str(self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0]))      # For debugging
+                                print("  - DIFF IN SECOND: " + str(i-indexInText))
+                                # print(" - WORD FOUND!")
+                                word = text[indexInText:i+1]
+                                wildCardPossibleFlag = False
+                                firstSubstringIndex = -1
+                                indexInText = -1
+                                wordFound = True
+                            elif self.wildcard_substring_indices[self.words[j]][0]-firstSubstringIndex[0] < i-indexInText:
+                                print("   - Limit reached, wildcard word not possible")
+                                word = text[indexInText:i+1]
+                                wildCardPossibleFlag = False
+                                firstSubstringIndex = -1
+                                indexInText = -1
                                 wordFound = False
-                                firstSubstringIndex = self.wildcard_substring_indices[self.words[j]]
-                                indexInText = i
-                                break
+                        # If the former portion of a wildcard string, set flags and continue
+                        elif wildCardPossibleFlag is False:
+                            print(" -  FORMER IS " + self.words[j])      # For debugging
+                            wildCardPossibleFlag = True
+                            wordFound = False
+                            firstSubstringIndex = self.wildcard_substring_indices[self.words[j]]
+                            indexInText = i
+                            break
 
-                            # # If out of range, reset all flags
-                            # if distance < i-indexInText:
-                            #     wildCardPossibleFlag = True
-                            #     wordFound = False
-                            #     distance = 99999
+                        # # If out of range, reset all flags
+                        # if distance < i-indexInText:
+                        #     wildCardPossibleFlag = True
+                        #     wordFound = False
+                        #     distance = 99999
                             
                   
   
-                    if wordFound is True:
-                        print("    - APPENDED WORD IS " + word)
-                    # Start index of word is (i-len(word)+1)
-                        result[word].append(i-len(word)+1)
+                if wordFound is True:
+                    print("    - APPENDED WORD IS " + word)
+                # Start index of word is (i-len(word)+1)
+                    result[word].append(i-len(word)+1)
   
         # Return the final result dictionary
         return result
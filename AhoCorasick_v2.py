@@ -5,9 +5,12 @@
 # This implementation of Aho-Corasick was sourced from:
 # https://www.geeksforgeeks.org/aho-corasick-algorithm-pattern-searching/
 #
-# Implementations of wildcard string matching may be found here:
-# https://www.geeksforgeeks.org/python-wildcard-substring-search/
-# https://www.tutorialspoint.com/How-do-we-use-re-finditer-method-in-Python-regular-expression
+# Wildcard words are matched with the "don't care" counting algorithm:
+# each word is split at its wildcards, the pieces are searched for with the
+# same machine as the other words, and a counter per possible start position
+# records how many pieces were found at the right distance from it.
+# More details may be found on page 4 of this:
+# http://www.cbcb.umd.edu/confcour/Spring2010/CMSC858W-materials/Lecture4.pdf
 #
 # These implementations were combined to complete the goal of this project.
 ###############################################################################################
@@ -16,226 +19,1843 @@
 # defaultdict is used only for storing the final output
 # We will return a dictionary where key is the matched word
 # and value is the list of indexes of matched word
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
 
-# re is a regex-matching library that aids in wildcard search.
+# array stores the goto and failure functions as flat typed buffers
+# (4 bytes per entry) instead of lists of Python ints.
+from array import array
+
+# regex is only used to reject wildcard matches that span whitespace.
 import regex
 
-# For simplicity, Arrays and Queues have been implemented using lists. 
-# If you want to improve performance try using them instead
-class AhoCorasick:
-    def __init__(self, words):
+# Used by the parallel search to split large texts and files over
+# several worker processes.
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-        # Max number of states in the matching machine.
-        # Should be equal to the sum of the length of all keywords.
-        self.max_states = sum([len(word) for word in words])
+# Used to write and read the header of a saved machine.
+import struct
+import sys
 
-        # Maximum number of characters.
-        # Currently supports only alphabets [a,z]
-        self.max_characters = 128
+# Used by the optional statistics (see MatcherStats).
+import json
+import time
 
-        # OUTPUT FUNCTION IS IMPLEMENTED USING out []
-        # Bit i in this mask is 1 if the word with
-        # index i appears when the machine enters this state.
-        # Lets say, a state outputs two words "he" and "she" and
-        # in our provided words list, he has index 0 and she has index 3
-        # so value of out[state] for this state will be 1001
-        # It has been initialized to all 0.
-        # We have taken one extra state for the root.
-        self.out = [0] * (self.max_states + 1)
+# Compact results of search_columnar and search_many.
+from MatchResult import BatchMatchResult, MatchResult
 
-        # FAILURE FUNCTION IS IMPLEMENTED USING fail []
-        # There is one value for each state + 1 for the root
-        # It has been initialized to all -1
-        # This will contain the fail state value for each state
-        self.fail = [-1] * (self.max_states + 1)
+# numpy is optional: when it is installed, large machines compute their
+# failure function with array operations (see __build_failure_numpy).
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-        # GOTO FUNCTION (OR TRIE) IS IMPLEMENTED USING goto [[]]
-        # Number of rows = max_states + 1
-        # Number of columns = max_characters i.e 26 in our case
-        # It has been initialized to all -1.
-        self.goto = [[-1] * self.max_characters for _ in range(self.max_states + 1)]
+# A built machine can be written to a file with save() and read back
+# with AhoCorasick.load(), which memory-maps the tables instead of
+# building them again.
+#
+# Words added or removed after the machine is built (add_pattern and
+# remove_pattern) do not touch its tables: added words go to a small delta
+# machine that is rebuilt on each change, removed words are skipped when
+# reported. Once there are more than merge_threshold such changes, they are
+# merged by building the whole machine again.
+class AhoCorasick:
+    def __init__(self, words, compiled=False, ignore_case=True, stats=False, storage=None,
+                 whole_words=False, delimiters=None, span_whitespace=False):
+
+        # With stats (True, or a MatcherStats to keep adding to) the machine
+        # records the time of each build phase and counters for every
+        # search, see MatcherStats. Without it nothing is recorded.
+        if stats is True:
+            stats = MatcherStats()
+        self.stats = stats or None
+        if self.stats is not None:
+            self.stats.phase('prepare')
+
+        # With ignore_case the search is case insensitive: the words are
+        # converted to lowercase, and the upper case form of each of their
+        # characters shares its alphabet class (see below), so the text
+        # itself is searched as it is, without making a lowercase copy.
+        self.ignore_case = ignore_case
+        if ignore_case:
+            for i in range(len(words)):
+                words[i] = words[i].lower()
 
-        # Convert all words to lowercase
-        # so that our search is case insensitive
-        for i in range(len(words)):
-            words[i] = words[i].lower()
+        # Words may be str or bytes (all of the same type), the text
+        # searched must then be of the same type.
+        self.binary = bool(words) and isinstance(words[0], bytes)
 
         # This character represents a wildcard.
-        self.wildcard = '*'
+        self.wildcard = b'*' if self.binary else '*'
 
         # All the words in dictionary which will be used to create Trie
         # The index of each keyword is important:
-        # "out[state] & (1 << i)" is > 0 if we just found word[i]
+        # i is in the output list of a state if we just found word[i]
         # in the text.
+        # Empty words (e.g. blank lines of a pattern file) are left out.
         self.words = []
         self.wildcardWords = []
         for word in words:
+            if not word:
+                continue
             if self.wildcard in word:
                 self.wildcardWords.append(word)
             else:
                 self.words.append(word)
 
+        # WILDCARD WORDS ARE SPLIT INTO PIECES
+        # Every maximal run of non-wildcard characters of a wildcard word
+        # is a piece, e.g. "p**t" has the pieces "p" and "t".
+        # The pieces are added to the Trie after the words, so output index
+        # len(words) + p stands for piece p. For each piece we keep the
+        # index of its wildcard word and the offset of its last character
+        # in that word, which gives the start of the word when the piece
+        # is found. wildcard_pieces[w] is the number of pieces of word w.
+        self.pieces = []
+        self.piece_word = []
+        self.piece_end = []
+        self.wildcard_pieces = []
+        for w, word in enumerate(self.wildcardWords):
+            count = 0
+            position = 0
+            for piece in word.split(self.wildcard):
+                if piece:
+                    self.pieces.append(piece)
+                    self.piece_word.append(w)
+                    self.piece_end.append(position + len(piece) - 1)
+                    count += 1
+                position += len(piece) + 1
+            self.wildcard_pieces.append(count)
+
+        # Each wildcard word w has a ring of counters, one per possible start
+        # position in the last len(word) characters of the text, stored in
+        # slots ring_start[w] up to ring_start[w] + len(word) - 1.
+        self.ring_start = []
+        ring_size = 0
+        for word in self.wildcardWords:
+            self.ring_start.append(ring_size)
+            ring_size += len(word)
+        self.ring_size = ring_size
+
+        # ALPHABET
+        # Only the symbols that appear in the words (and pieces) get a
+        # column in goto: alphabet maps each of them to a class 1, 2, ...
+        # and every other symbol of the text shares class 0.
+        # For bytes the symbols are the byte values.
+        self.alphabet = {}
+        for word in self.words + self.pieces:
+            for character in word:
+                if character not in self.alphabet:
+                    self.alphabet[character] = len(self.alphabet) + 1
+
+        # Number of symbol classes, i.e. the alphabet plus class 0.
+        # Counted before the case forms below, which add no class.
+        self.max_characters = len(self.alphabet) + 1
+
+        # A character whose lowercase form is in the alphabet gets the same
+        # class, which is what lowercasing the text would have done.
+        if ignore_case:
+            for character, ch in list(self.alphabet.items()):
+                for other in _case_forms(character, self.binary):
+                    self.alphabet.setdefault(other, ch)
+
+        # Max number of states in the matching machine.
+        # Should be equal to the sum of the length of all keywords.
+        self.max_states = sum([len(word) for word in words])
+
+        # WORD BOUNDARIES
+        # With whole_words a match is only reported if the characters just
+        # before and after it separate words (or are the start / end of the
+        # text). delimiters is a string (or bytes) of the characters that
+        # separate words, by default every character that is not a letter,
+        # a digit or an underscore. The boundaries are checked during the
+        # scan, so a match inside a word is never reported at all.
+        # Wildcards do not match whitespace unless span_whitespace is set.
+        self.whole_words = whole_words
+        self.delimiters = delimiters
+        self.span_whitespace = span_whitespace
+        self.__classify_delimiters()
+
+        # In compiled mode every missing goto edge is resolved through the
+        # failure links while the machine is built, so goto becomes the full
+        # DFA transition function and each text character costs exactly one
+        # table lookup during the search.
+        self.compiled = compiled
+
+        # STORAGE OF THE GOTO FUNCTION
+        # 'dense' keeps a full row of max_characters entries per state (see
+        # goto below). 'sparse' only stores the real edges, in a double array
+        # (see __build_sparse_machine), which is what large word lists need:
+        # almost every deep state has a single child. By default (None) the
+        # sparse storage is used when the dense table could get larger than
+        # _DENSE_LIMIT entries. A compiled sparse machine only has full rows
+        # up to depth _DENSE_DEPTH: a character costs one lookup there, but
+        # deeper states still follow failure links on a missing edge. Ask for
+        # storage='dense' to get exactly one lookup per character whatever
+        # the size.
+        if storage is None:
+            storage = 'sparse' if (self.max_states + 1) * self.max_characters > _DENSE_LIMIT else 'dense'
+        if storage not in ('dense', 'sparse'):
+            raise ValueError("storage must be 'dense' or 'sparse', not {storage!r}".format(storage=storage))
+        self.sparse = storage == 'sparse'
+
+        # OUTPUT FUNCTION IS IMPLEMENTED USING out_start [], out_words []
+        # AND dict_link []
+        # The indices of the words that end exactly at state s are
+        # out_words[out_start[s]:out_start[s + 1]] (most states have none).
+        # dict_link[s] is the nearest state on the failure chain of s
+        # whose output list is not empty, or -1 if there is none.
+        # Lets say, a state outputs "she" and its failure state outputs "he";
+        # the state only stores "she" and its dict_link points at "he",
+        # so reporting a hit only visits the words that actually end there.
+        # output_link[s] is s itself if words end at s, otherwise dict_link[s]:
+        # the first state whose words are reported when the scan reaches s,
+        # so a state without any match costs a single lookup.
+        # These are filled in once the Trie has been built.
+        self.out_start = array('i')
+        self.out_words = array('i')
+        self.dict_link = array('i', [-1]) * (self.max_states + 1)
+
+        # FAILURE FUNCTION IS IMPLEMENTED USING fail []
+        # There is one value for each state + 1 for the root
+        # It has been initialized to all -1
+        # This will contain the fail state value for each state
+        self.fail = array('i', [-1]) * (self.max_states + 1)
+
+        # GOTO FUNCTION (OR TRIE) IS IMPLEMENTED USING goto []
+        # The table is stored row-major in one flat buffer:
+        # the edge for character ch out of state s is goto[s * max_characters + ch].
+        # Number of rows = max_states + 1
+        # Number of columns = max_characters
+        # It has been initialized to all -1.
+        # With the sparse storage goto stays empty and base / check / target
+        # hold the edges instead.
+        if self.sparse:
+            self.goto = array('i')
+        else:
+            self.goto = array('i', [-1]) * ((self.max_states + 1) * self.max_characters)
+        self.base = array('i')
+        self.check = array('i')
+        self.target = array('i')
+
+        # Length of the longest wildcard word. A streaming search keeps
+        # this many characters minus one from the end of each chunk.
+        self.wildcard_length = max([len(word) for word in self.wildcardWords], default=0)
+
+        # Length of the longest word of any kind. A parallel search pads
+        # each chunk with this many characters minus one.
+        self.max_word_length = max([len(word) for word in words], default=0)
+
         # Once the Trie has been built, it will contain the number
         # of nodes in Trie which is total number of states required <= max_states
         self.states_count = self.__build_matching_machine()
+        self.__link_outputs()
+        if self.stats is not None:
+            self.stats.phase(None)
+            self.stats.build['states'] = self.states_count
+            self.stats.build['table_bytes'] = self.table_bytes()
+
+        # Pattern ids are the indices in words followed by those in
+        # wildcardWords. removed holds the ids of removed words, added the
+        # words added since the machine was built and delta their machine.
+        self.removed = set()
+        self.added = []
+        self.delta = None
+        self.merge_threshold = max(64, int(len(words) ** 0.5))
+        self.__index_words()
+
+        # Set by load() for a memory-mapped machine
+        self.source = None
+
+        # Set by freeze() for a machine shared by several users
+        self.frozen = False
 
     # Builds the String matching machine.
     # Returns the number of states that the built machine has.
     # States are numbered 0 up to the return value - 1, inclusive.
     def __build_matching_machine(self):
-        k = len(self.words)
+        if self.sparse:
+            return self.__build_sparse_machine()
+
+        keywords = self.words + self.pieces
+        k = len(keywords)
+        goto = self.goto
+        width = self.max_characters
 
         # Initially, we just have the 0 state
         states = 1
+        if self.stats is not None:
+            self.stats.phase('trie')
+
+        # (state, word index) pairs for the output function
+        ends = []
 
         # Convalues for goto function, i.e., fill goto
         # This is same as building a Trie for words[]
         for i in range(k):
-            word = self.words[i]
+            word = keywords[i]
             current_state = 0
 
             # Process all the characters of the current word
             for character in word:
-                ch = ord(character) - 97  # Ascii value of 'a' = 97
+                edge = current_state * width + self.alphabet[character]
 
                 # Allocate a new node (create a new state)
                 # if a node for ch doesn't exist.
-                if self.goto[current_state][ch] == -1:
-                    self.goto[current_state][ch] = states
+                if goto[edge] == -1:
+                    goto[edge] = states
                     states += 1
 
-                current_state = self.goto[current_state][ch]
+                current_state = goto[edge]
 
             # Add current word in output function
-            self.out[current_state] |= (1 << i)
+            ends.append((current_state, i))
+
+        # Only the rows of states that were actually created are kept.
+        del goto[states * width:]
+        del self.fail[states:]
+        del self.dict_link[states:]
+
+        self.__pack_outputs(ends, states)
+        out_start = self.out_start
+
+        if self.stats is not None:
+            self.stats.phase('failure')
+        if numpy is not None and states >= _NUMPY_MIN_STATES:
+            self.__build_failure_numpy(states)
+            return states
 
         # For all characters which don't have
         # an edge from root (or state 0) in Trie,
         # add a goto edge to state 0 itself
-        for ch in range(self.max_characters):
-            if self.goto[0][ch] == -1:
-                self.goto[0][ch] = 0
+        for ch in range(width):
+            if goto[ch] == -1:
+                goto[ch] = 0
 
         # Failure function is computed in
         # breadth first order using a queue
-        queue = []
+        queue = deque()
 
         # Iterate over every possible input
-        for ch in range(self.max_characters):
+        for ch in range(width):
 
             # All nodes of depth 1 have failure
             # function value as 0. For example,
             # in above diagram we move to 0
             # from states 1 and 3.
-            if self.goto[0][ch] != 0:
-                self.fail[self.goto[0][ch]] = 0
-                queue.append(self.goto[0][ch])
+            if goto[ch] != 0:
+                self.fail[goto[ch]] = 0
+                queue.append(goto[ch])
 
         # Now queue has states 1 and 3
         while queue:
 
             # Remove the front state from queue
-            state = queue.pop(0)
+            state = queue.popleft()
+            row = state * width
+            fail_row = self.fail[state] * width
 
             # For the removed state, find failure
             # function for all those characters
             # for which goto function is not defined.
-            for ch in range(self.max_characters):
+            for ch in range(width):
+                child = goto[row + ch]
 
-                # If goto function is defined for
-                # character 'ch' and 'state'
-                if self.goto[state][ch] != -1:
+                # In compiled mode a missing edge takes the transition of the
+                # failure state. That row is already complete because the
+                # failure state is shallower and was dequeued before us.
+                if child == -1:
+                    if self.compiled:
+                        goto[row + ch] = goto[fail_row + ch]
+                    continue
 
-                    # Find failure state of removed state
-                    failure = self.fail[state]
+                # Goto function is defined for
+                # character 'ch' and 'state'.
+                # Find the deepest node labeled by proper
+                # suffix of String from root to current state.
+                failure = self.fail[state]
+                while goto[failure * width + ch] == -1:
+                    failure = self.fail[failure]
 
-                    # Find the deepest node labeled by proper
-                    # suffix of String from root to current state.
-                    while self.goto[failure][ch] == -1:
-                        failure = self.fail[failure]
+                failure = goto[failure * width + ch]
+                self.fail[child] = failure
+
+                # Link to the nearest suffix state that has outputs
+                if out_start[failure] != out_start[failure + 1]:
+                    self.dict_link[child] = failure
+                else:
+                    self.dict_link[child] = self.dict_link[failure]
+
+                # Insert the next level node (of Trie) in Queue
+                queue.append(child)
+
+        return states
 
-                    failure = self.goto[failure][ch]
-                    self.fail[self.goto[state][ch]] = failure
+    # NumPy version of the failure function part of __build_matching_machine.
+    # The states are handled one depth level of the Trie at a time: for all
+    # the edges (state, ch) -> child out of a level at once, the failure of
+    # child is the DFA transition from fail[state] on ch, and its dict_link
+    # follows from that failure state, which is shallower. Then the rows of
+    # the level are completed into DFA rows (a missing edge takes the
+    # transition of the failure state) for the next levels to use.
+    # In compiled mode the DFA rows are goto itself, otherwise they are
+    # built in a copy of goto that is dropped at the end.
+    def __build_failure_numpy(self, states):
+        width = self.max_characters
+        goto = numpy.frombuffer(self.goto, dtype=numpy.intc).reshape(states, width)
+        fail = numpy.frombuffer(self.fail, dtype=numpy.intc)
+        dict_link = numpy.frombuffer(self.dict_link, dtype=numpy.intc)
+        out_start = numpy.frombuffer(self.out_start, dtype=numpy.intc)
+        has_output = out_start[1:] != out_start[:-1]
 
-                    # Merge output values
-                    self.out[self.goto[state][ch]] |= self.out[failure]
+        # The states of depth 1 fail to the root, and a missing
+        # edge of the root leads back to it
+        root = goto[0]
+        level = root[root != -1]
+        root[root == -1] = 0
+        fail[level] = 0
+        dfa = goto if self.compiled else goto.copy()
 
-                    # Insert the next level node (of Trie) in Queue
-                    queue.append(self.goto[state][ch])
+        while level.size:
+            rows = goto[level]
+            fail_rows = dfa[fail[level]]
 
+            # Failure and dictionary links of the next level
+            missing = rows == -1
+            parents, chs = numpy.nonzero(~missing)
+            children = rows[parents, chs]
+            failure = fail_rows[parents, chs]
+            fail[children] = failure
+            dict_link[children] = numpy.where(has_output[failure], failure, dict_link[failure])
+
+            rows[missing] = fail_rows[missing]
+            dfa[level] = rows
+            level = children
+
+    # Packs the output lists of all states into out_start / out_words,
+    # ends being the (state, word index) pairs.
+    def __pack_outputs(self, ends, states):
+        if self.stats is not None:
+            self.stats.phase('outputs')
+        ends.sort()
+        self.out_words = array('i', [i for _, i in ends])
+        self.out_start = array('i', [0]) * (states + 1)
+        for state, _ in ends:
+            self.out_start[state + 1] += 1
+        for state in range(states):
+            self.out_start[state + 1] += self.out_start[state]
+
+    # Fills output_link from out_start and dict_link, once the failure
+    # function is built.
+    def __link_outputs(self):
+        states = self.states_count
+        if numpy is not None and states >= _NUMPY_MIN_STATES:
+            out_start = numpy.frombuffer(self.out_start, dtype=numpy.intc)
+            dict_link = numpy.frombuffer(self.dict_link, dtype=numpy.intc)
+            link = numpy.where(out_start[1:] != out_start[:-1],
+                               numpy.arange(states, dtype=numpy.intc), dict_link)
+            self.output_link = array('i')
+            self.output_link.frombytes(link.astype(numpy.intc).tobytes())
+            return
+
+        out_start = self.out_start
+        dict_link = self.dict_link
+        self.output_link = array('i', [state if out_start[state] != out_start[state + 1] else dict_link[state]
+                                       for state in range(states)])
+
+    # Builds the machine with the sparse storage of the goto function.
+    # Returns the number of states, like __build_matching_machine.
+    #
+    # The edges are kept in a double array: the edge for class ch out of
+    # state s is slot t = base[s] + ch if check[t] == s, and leads to state
+    # target[t]. Each state gets a base where the slots of all its edges are
+    # still free, so the slots of different states interleave and there is
+    # about one slot per edge. The root has a full row (a missing edge leads
+    # back to the root), so a failed lookup can always fall back to it.
+    # In compiled mode the states up to depth _DENSE_DEPTH also get full
+    # rows, with the missing edges resolved as in the dense DFA; deeper
+    # states keep their real edges only and fall back on their failure
+    # links during the search.
+    #
+    # The trie is first built with first-child / next-sibling links, so the
+    # build never needs more than a few integers per state either.
+    def __build_sparse_machine(self):
+        keywords = self.words + self.pieces
+        width = self.max_characters
+        alphabet = self.alphabet
+        size = self.max_states + 1
+        if self.stats is not None:
+            self.stats.phase('trie')
+
+        first_child = array('i', [-1]) * size
+        next_sibling = array('i', [-1]) * size
+        label = array('i', [0]) * size
+        states = 1
+        ends = []
+        for i, word in enumerate(keywords):
+            current_state = 0
+            for character in word:
+                ch = alphabet[character]
+                child = first_child[current_state]
+                while child != -1 and label[child] != ch:
+                    child = next_sibling[child]
+                if child == -1:
+                    child = states
+                    states += 1
+                    label[child] = ch
+                    next_sibling[child] = first_child[current_state]
+                    first_child[current_state] = child
+                current_state = child
+            ends.append((current_state, i))
+
+        del self.fail[states:]
+        del self.dict_link[states:]
+        self.__pack_outputs(ends, states)
+        out_start = self.out_start
+        fail = self.fail
+        dict_link = self.dict_link
+
+        if self.stats is not None:
+            self.stats.phase('failure')
+        base = self.base = array('i', [0]) * states
+        check = self.check = array('i', [-1]) * width
+        target = self.target = array('i', [0]) * width
+        depth = array('i', [0]) * states if self.compiled else None
+
+        # The root row: slots 0 up to width - 1
+        for ch in range(width):
+            check[ch] = 0
+        child = first_child[0]
+        while child != -1:
+            target[label[child]] = child
+            fail[child] = 0
+            if depth is not None:
+                depth[child] = 1
+            child = next_sibling[child]
+
+        # The free slots, in increasing order, are kept in a doubly linked
+        # list (next_free / prev_free, -2 once a slot has left the list,
+        # head and tail -1 when it is empty), so first fit only visits free
+        # slots. A slot where the first edge of a row has failed to fit
+        # _PLACEMENT_TRIES times is also dropped from the list (it may still
+        # take a later edge of a row), so each slot is tried a bounded number
+        # of times and the placement stays linear in the number of slots.
+        next_free = array('i', [-2]) * len(check)
+        prev_free = array('i', [-2]) * len(check)
+        tries = bytearray(len(check))
+        head = tail = -1
+
+        def grow(count):
+            # Adds count free slots at the end of the list
+            nonlocal head, tail
+            start = len(check)
+            check.extend(array('i', [-1]) * count)
+            target.extend(array('i', [0]) * count)
+            next_free.extend(range(start + 1, start + count + 1))
+            prev_free.extend(range(start - 1, start + count - 1))
+            tries.extend(bytes(count))
+            prev_free[start] = tail
+            next_free[start + count - 1] = -1
+            if tail == -1:
+                head = start
+            else:
+                next_free[tail] = start
+            tail = start + count - 1
+
+        def unlink(slot):
+            nonlocal head, tail
+            before = prev_free[slot]
+            after = next_free[slot]
+            if before == -1:
+                head = after
+            else:
+                next_free[before] = after
+            if after == -1:
+                tail = before
+            else:
+                prev_free[after] = before
+            next_free[slot] = prev_free[slot] = -2
+
+        grow(width)
+
+        # States are placed and get their failure links in breadth first
+        # order, so the rows of all shallower states are in place when the
+        # children of a state look for their failure states.
+        queue = deque()
+        child = first_child[0]
+        while child != -1:
+            queue.append(child)
+            child = next_sibling[child]
+
+        while queue:
+            state = queue.popleft()
+            children = []
+            child = first_child[state]
+            while child != -1:
+                children.append((label[child], child))
+                queue.append(child)
+                child = next_sibling[child]
+            children.sort()
+
+            # Place the row of the state
+            if depth is not None and depth[state] <= _DENSE_DEPTH:
+                # A full row at the end of the slots, the missing edges
+                # taking the transition of the failure state (a full row too)
+                position = len(check)
+                check.extend(array('i', [state]) * width)
+                target.extend(array('i', [0]) * width)
+                next_free.extend(array('i', [-2]) * width)
+                prev_free.extend(array('i', [-2]) * width)
+                tries.extend(bytes(width))
+                fail_base = base[fail[state]]
+                for ch in range(width):
+                    target[position + ch] = target[fail_base + ch]
+                for ch, child in children:
+                    target[position + ch] = child
+            elif children:
+                # First fit: try the free slots for the first edge in turn.
+                # They all lie past the root row, so position is positive.
+                first = children[0][0]
+                slot = head
+                while True:
+                    if slot == -1:
+                        slot = len(check)
+                        grow(width)
+                    position = slot - first
+                    if position + width > len(check):
+                        grow(position + width - len(check))
+                    if all(check[position + ch] == -1 for ch, _ in children):
+                        break
+                    following = next_free[slot]
+                    tries[slot] += 1
+                    if tries[slot] == _PLACEMENT_TRIES:
+                        unlink(slot)
+                    slot = following
+                for ch, child in children:
+                    check[position + ch] = state
+                    target[position + ch] = child
+                    if next_free[position + ch] != -2:
+                        unlink(position + ch)
+            else:
+                position = 0
+            base[state] = position
+
+            # Failure links of the children
+            for ch, child in children:
+                if depth is not None:
+                    depth[child] = depth[state] + 1
+                failure = fail[state]
+                while check[base[failure] + ch] != failure:
+                    failure = fail[failure]
+                failure = target[base[failure] + ch]
+                fail[child] = failure
+
+                # Link to the nearest suffix state that has outputs
+                if out_start[failure] != out_start[failure + 1]:
+                    dict_link[child] = failure
+                else:
+                    dict_link[child] = dict_link[failure]
+
+        # Every base + ch of a lookup must be a slot
+        end = max(base, default=0) + width
+        if end > len(check):
+            check.extend(array('i', [-1]) * (end - len(check)))
+            target.extend(array('i', [0]) * (end - len(target)))
         return states
 
-    # Returns the next state the machine will transition to using goto
-    # and failure functions.
-    # current_state - The current state of the machine. Must be between
-    #             0 and the number of states - 1, inclusive.
-    # next_input - The next character that enters into the machine.
-    def __find_next_state(self, current_state, next_input):
-        answer = current_state
-        ch = ord(next_input) - 97  # Ascii value of 'a' is 97
+    # Sorts the symbol classes for the whole_words checks:
+    # delimiter_classes[ch] is 1 if every symbol of class ch is a delimiter,
+    # 0 if none is, and 2 if the symbol itself has to be tested (class 0,
+    # which holds every symbol missing from the alphabet, or a class mixing
+    # both). So most boundaries are decided by the class the scan looks up
+    # anyway.
+    def __classify_delimiters(self):
+        is_delimiter = self.__delimiter_test()
+        flags = [2] + [None] * (self.max_characters - 1)
+        for character, ch in self.alphabet.items():
+            flag = 1 if is_delimiter(character) else 0
+            flags[ch] = flag if flags[ch] in (None, flag) else 2
+        self.delimiter_classes = bytes(2 if flag is None else flag for flag in flags)
+
+    # Returns the function telling if a symbol is a delimiter.
+    def __delimiter_test(self):
+        if self.delimiters is not None:
+            return frozenset(self.delimiters).__contains__
+        if self.binary:
+            return _BYTE_DELIMITERS.__contains__
+        return _is_word_delimiter
+
+    # Writes the built machine to path (merging added and removed words first).
+    # The file starts with a header (see _HEADER) followed by the tables
+    # listed in _TABLES as native 32-bit integers, the alphabet as
+    # (symbol code, class) pairs, the byte lengths of the words, wildcard
+    # words and pieces, their text (UTF-8 unless it is bytes) and the
+    # delimiters, if any.
+    def save(self, path):
+        if self.added or self.removed:
+            self.merge()
+        strings = self.words + self.wildcardWords + self.pieces
+        if not self.binary:
+            strings = [word.encode('utf-8') for word in strings]
+        symbols = array('i')
+        for character, ch in self.alphabet.items():
+            symbols.extend((character if self.binary else ord(character), ch))
+        delimiters = self.delimiters
+        if delimiters is not None and not self.binary:
+            delimiters = delimiters.encode('utf-8')
+        header = _HEADER.pack(_MAGIC, sys.byteorder[0].encode(), self.compiled, self.binary, self.ignore_case,
+                              self.sparse, self.whole_words, self.span_whitespace, self.states_count,
+                              self.max_characters, len(self.words), len(self.wildcardWords),
+                              len(self.pieces), len(self.out_words), self.max_states, self.ring_size,
+                              self.wildcard_length, self.max_word_length, len(self.check),
+                              len(self.alphabet), -1 if delimiters is None else len(delimiters))
+        with open(path, 'wb') as file:
+            file.write(header)
+            for name in _TABLES:
+                table = getattr(self, name)
+                file.write(array('i', table) if isinstance(table, list) else table)
+            file.write(symbols)
+            file.write(array('i', [len(string) for string in strings]))
+            file.write(b''.join(strings))
+            if delimiters is not None:
+                file.write(delimiters)
+
+    # Reads a machine written by save().
+    # With use_mmap the file is memory-mapped and the tables are read-only
+    # views into it, so nothing is rebuilt or copied and every process that
+    # loads the same file shares one copy of it in the page cache.
+    # Otherwise the tables are read into arrays.
+    # Raises ValueError if the file is not a saved machine or is shorter
+    # than its header says.
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        with open(path, 'rb') as file:
+            if use_mmap:
+                data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                data = memoryview(file.read())
+
+        if len(data) < _HEADER.size:
+            raise ValueError("{path} is not a saved AhoCorasick machine".format(path=path))
+        (magic, byteorder, compiled, binary, ignore_case, sparse, whole_words, span_whitespace,
+         states, width, num_words, num_wildcards, num_pieces, num_outputs, max_states, ring_size,
+         wildcard_length, max_word_length, slots, num_symbols, delimiters_length) = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("{path} is not a saved AhoCorasick machine".format(path=path))
+        if byteorder != sys.byteorder[0].encode():
+            raise ValueError("{path} was saved on a machine with a different byte order".format(path=path))
+
+        sizes = {'goto': 0 if sparse else states * width,
+                 'base': states if sparse else 0, 'check': slots, 'target': slots,
+                 'fail': states, 'dict_link': states, 'output_link': states,
+                 'out_start': states + 1, 'out_words': num_outputs,
+                 'piece_word': num_pieces, 'piece_end': num_pieces,
+                 'wildcard_pieces': num_wildcards, 'ring_start': num_wildcards,
+                 'symbols': 2 * num_symbols}
+        num_strings = num_words + num_wildcards + num_pieces
+
+        # The tables must all be there before they are cast
+        counts = [sizes.get(name, num_strings) for name in _TABLES + ('symbols', 'lengths')]
+        if min(counts) < 0 or len(data) < _HEADER.size + 4 * sum(counts):
+            raise ValueError("{path} is truncated".format(path=path))
+
+        # Skip __init__, every attribute comes from the file
+        matcher = cls.__new__(cls)
+        position = _HEADER.size
+        for name in _TABLES + ('symbols', 'lengths'):
+            size = sizes.get(name, num_strings)
+            table = data[position:position + 4 * size].cast('i')
+            if not use_mmap:
+                table = array('i', table)
+            setattr(matcher, name, table)
+            position += 4 * size
+
+        if position + sum(matcher.lengths) + max(delimiters_length, 0) > len(data):
+            raise ValueError("{path} is truncated".format(path=path))
+        strings = []
+        for length in matcher.lengths:
+            string = bytes(data[position:position + length])
+            strings.append(string if binary else string.decode('utf-8'))
+            position += length
+        del matcher.lengths
 
-        # If goto is not defined, use
-        # failure function
-        while self.goto[answer][ch] == -1:
-            answer = self.fail[answer]
+        delimiters = None
+        if delimiters_length >= 0:
+            delimiters = bytes(data[position:position + delimiters_length])
+            if not binary:
+                delimiters = delimiters.decode('utf-8')
 
-        return self.goto[answer][ch]
+        symbols = matcher.symbols
+        matcher.alphabet = {}
+        for i in range(0, len(symbols), 2):
+            matcher.alphabet[symbols[i] if binary else chr(symbols[i])] = symbols[i + 1]
+        del matcher.symbols
+
+        matcher.words = strings[:num_words]
+        matcher.wildcardWords = strings[num_words:num_words + num_wildcards]
+        matcher.pieces = strings[num_words + num_wildcards:]
+        matcher.binary = binary
+        matcher.wildcard = b'*' if binary else '*'
+        matcher.compiled = compiled
+        matcher.sparse = sparse
+        matcher.ignore_case = ignore_case
+        matcher.states_count = states
+        matcher.max_characters = width
+        matcher.max_states = max_states
+        matcher.ring_size = ring_size
+        matcher.wildcard_length = wildcard_length
+        matcher.max_word_length = max_word_length
+        matcher.whole_words = whole_words
+        matcher.delimiters = delimiters
+        matcher.span_whitespace = span_whitespace
+        matcher.__classify_delimiters()
+        matcher.source = path if use_mmap else None
+        matcher.frozen = False
+        matcher.removed = set()
+        matcher.added = []
+        matcher.delta = None
+        matcher.merge_threshold = max(64, int((num_words + num_wildcards) ** 0.5))
+        matcher.__index_words()
+        matcher.stats = None
+        return matcher
+
+    # A memory-mapped machine is pickled as its file name (for example when it
+    # is sent to the workers of a parallel search), and the receiving process
+    # maps the same file again instead of getting a copy of the tables.
+    # Added and removed words travel along with the file name.
+    def __getstate__(self):
+        if self.source:
+            return {'source': self.source, 'removed': self.removed,
+                    'added': self.added, 'delta': self.delta}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if 'goto' not in state:
+            changes = state
+            state = AhoCorasick.load(state['source']).__dict__
+            state.update(changes)
+        self.__dict__.update(state)
+
+    # Returns all the words searched for, in pattern id order
+    # (removed words are left out, added words are at the end).
+    def patterns(self):
+        patterns = [word for i, word in enumerate(self.words + self.wildcardWords)
+                    if i not in self.removed]
+        return patterns + self.added
+
+    # Maps every word and wildcard word of the machine to its pattern id, or
+    # to the list of its ids if it was given more than once, so that adding
+    # and removing words does not go through the whole dictionary.
+    # Also keeps the patterns in id order and their lengths, which every
+    # search reports with, so that a search of a short text does not cost
+    # a pass over the whole dictionary.
+    def __index_words(self):
+        self.pattern_words = self.words + self.wildcardWords
+        self.word_lengths = array('i', [len(word) for word in self.pattern_words])
+        self.pattern_table = None
+        self.blank_words = [(w, len(word)) for w, word in enumerate(self.wildcardWords)
+                            if not word.strip(self.wildcard)]
+        word_ids = self.word_ids = {}
+        for i, word in enumerate(self.pattern_words):
+            ids = word_ids.setdefault(word, i)
+            if ids != i:
+                if isinstance(ids, int):
+                    word_ids[word] = [ids, i]
+                else:
+                    ids.append(i)
+
+    # Returns the pattern ids of word in this machine (not in the delta machine).
+    def __ids_of(self, word):
+        ids = self.word_ids.get(word, ())
+        return (ids,) if isinstance(ids, int) else ids
+
+    # Adds a word (which may contain wildcards) to the machine.
+    # Only the delta machine of the added words is built again.
+    def add_pattern(self, word):
+        self.__check_frozen()
+        # Empty words are left out, as in __init__
+        if not word:
+            return
+        if self.ignore_case:
+            word = word.lower()
+
+        # Adding back a removed word only has to undo the removal
+        if self.removed:
+            for i in self.__ids_of(word):
+                if i in self.removed:
+                    self.removed.discard(i)
+                    return
+
+        self.added.append(word)
+        self.max_word_length = max(self.max_word_length, len(word))
+        self.__changed()
+
+    # Removes one occurrence of a word from the machine.
+    # Raises ValueError if the word is not searched for.
+    def remove_pattern(self, word):
+        self.__check_frozen()
+        if self.ignore_case:
+            word = word.lower()
+        if word in self.added:
+            self.added.remove(word)
+            self.__changed()
+            return
+
+        for i in self.__ids_of(word):
+            if i not in self.removed:
+                self.removed.add(i)
+                self.__changed()
+                return
+
+        raise ValueError("{word} is not a pattern of this machine".format(word=word))
+
+    # Builds the whole machine again from patterns(), which merges
+    # the added and removed words into its tables.
+    def merge(self):
+        self.__check_frozen()
+        self.__init__(self.patterns(), compiled=self.compiled, ignore_case=self.ignore_case,
+                      stats=self.stats, storage='sparse' if self.sparse else 'dense',
+                      whole_words=self.whole_words, delimiters=self.delimiters,
+                      span_whitespace=self.span_whitespace)
+
+    # Makes the words of the machine fixed: add_pattern, remove_pattern and
+    # merge raise ValueError from now on, e.g. for a machine that several
+    # users share (see MatcherCache).
+    def freeze(self):
+        self.frozen = True
+
+    def __check_frozen(self):
+        if self.frozen:
+            raise ValueError("the words of a frozen machine cannot be changed")
+
+    # Called after every add / remove: merges when there are too many
+    # changes, otherwise builds the delta machine of the added words.
+    def __changed(self):
+        self.pattern_table = None
+        if len(self.added) + len(self.removed) > self.merge_threshold:
+            self.merge()
+        else:
+            self.delta = AhoCorasick(list(self.added), compiled=self.compiled, ignore_case=self.ignore_case,
+                                     whole_words=self.whole_words, delimiters=self.delimiters,
+                                     span_whitespace=self.span_whitespace) if self.added else None
+
+    # Returns the number of bytes used by the tables of the machine.
+    def table_bytes(self):
+        return sum(memoryview(table).nbytes if not isinstance(table, list) else 4 * len(table)
+                   for table in (getattr(self, name) for name in _TABLES))
+
+    # Turns the statistics on (see MatcherStats), e.g. for a loaded machine.
+    # callback, if given, is called with the record of every search.
+    def enable_stats(self, callback=None):
+        if self.stats is None:
+            self.stats = MatcherStats()
+            self.stats.build['states'] = self.states_count
+            self.stats.build['table_bytes'] = self.table_bytes()
+        self.stats.callback = callback
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+
+    # Starts a scan, with hit counters when statistics are on.
+    def __new_scan(self):
+        scan = _ScanState()
+        if self.stats is not None:
+            scan.pattern_hits = Counter()
+            scan.started = time.perf_counter()
+        return scan
+
+    # Adds the counters of a finished scan to the statistics.
+    def __record(self, method, scan):
+        record = {'method': method,
+                  'seconds': time.perf_counter() - scan.started,
+                  'characters': scan.offset,
+                  'fail_transitions': 0,
+                  'wildcard_attempts': 0,
+                  'wildcard_verifications': 0,
+                  'hits': 0,
+                  'pattern_hits': Counter()}
+        matcher = self
+        while scan is not None:
+            record['fail_transitions'] += scan.fail_transitions
+            record['wildcard_attempts'] += scan.wildcard_attempts
+            record['wildcard_verifications'] += scan.wildcard_verifications
+            patterns = matcher.pattern_words
+            for pattern, hits in scan.pattern_hits.items():
+                record['hits'] += hits
+                record['pattern_hits'][patterns[pattern]] += hits
+            scan, matcher = scan.delta, matcher.delta
+        record['pattern_hits'] = dict(record['pattern_hits'])
+        self.stats.record(record)
 
     # This function finds all occurrences of all words in text.
     def search_words(self, text):
-        # Convert the text to lowercase to make search case insensitive
-        text = text.lower()
-        
-        # Initialize current_state to 0
-        current_state = 0
-
         # A dictionary to store the result.
         # Key here is the found word
         # Value is a list of all occurrences start index
         result = defaultdict(list)
 
-        # Handle wildcard words
-        for word in self.wildcardWords:
-            self.findWildcardMatch(result, text, word)
+        # Traverse the text through the built machine
+        # to find all occurrences of words
+        scan = self.__new_scan()
+        for word, start in self.__matches(text, scan, final=True):
+            result[word].append(start)
+        if self.stats is not None:
+            self.__record('search_words', scan)
+
+        # Return the final result dictionary
+        return result
+
+    # Columnar version of search_words.
+    # Returns a MatchResult with one (pattern id, start, end) row per match,
+    # in the order they are found. The ids index result.patterns (the words,
+    # the wildcard words, then the added words). No string or list is made
+    # per match, see MatchResult for grouping by pattern.
+    def search_columnar(self, text):
+        patterns, lengths = self.__pattern_table()
+        result = MatchResult(patterns)
+        pattern_ids, starts, ends = result.pattern_id, result.start, result.end
+
+        scan = self.__new_scan()
+        for pattern, start in self.__pattern_ids(text, scan, final=True):
+            pattern_ids.append(pattern)
+            starts.append(start)
+            ends.append(start + lengths[pattern])
+        if self.stats is not None:
+            self.__record('search_columnar', scan)
+        return result
+
+    # Batch version of search_columnar for many (short) documents.
+    # Returns a BatchMatchResult with one (document index, pattern id, start,
+    # end) row per match, offsets being relative to the document.
+    # The whole batch is searched with one scan: the machine restarts at each
+    # document, but the pattern table and the wildcard counters are only
+    # made once.
+    # With workers > 1 the documents are split into batches of batch_size,
+    # searched by a pool of worker processes, or of threads with
+    # pool='thread' (which only run in parallel on a free-threaded Python).
+    # Statistics are not recorded for a batch split over workers.
+    def search_many(self, documents, workers=1, pool='process', batch_size=None):
+        if pool not in ('process', 'thread'):
+            raise ValueError("pool must be 'process' or 'thread', not {pool!r}".format(pool=pool))
+        if workers > 1:
+            if not isinstance(documents, (list, tuple)):
+                documents = list(documents)
+            if batch_size is None:
+                batch_size = max(len(documents) // (workers * 4), 1024)
+            if len(documents) > batch_size:
+                return self.__search_batches(documents, workers, pool, batch_size)
+
+        scan = self.__new_scan()
+        result = self.__search_batch(documents, scan)
+        if self.stats is not None:
+            self.__record('search_many', scan)
+        return result
+
+    # Searches every document of documents, continuing scan.
+    def __search_batch(self, documents, scan):
+        patterns, lengths = self.__pattern_table()
+        result = BatchMatchResult(patterns)
+        document_ids, pattern_ids = result.document, result.pattern_id
+        starts, ends = result.start, result.end
+
+        for document, text in enumerate(documents):
+            # Restart the machine (and the delta machine) at the document
+            state = scan
+            while state is not None:
+                state.state = 0
+                state.tail = ''
+                state.pending.clear()
+                state.held.clear()
+                state.floor = state.offset
+                state = state.delta
+
+            floor = scan.floor
+            for pattern, start in self.__pattern_ids(text, scan, final=True):
+                document_ids.append(document)
+                pattern_ids.append(pattern)
+                starts.append(start - floor)
+                ends.append(start - floor + lengths[pattern])
+        return result
+
+    # Runs search_many over batches of documents on a pool and
+    # merges their results in order.
+    def __search_batches(self, documents, workers, pool, batch_size):
+        bounds = [(start, min(start + batch_size, len(documents)))
+                  for start in range(0, len(documents), batch_size)]
+        workers = min(workers, len(bounds))
+        if pool == 'thread':
+            executor = ThreadPoolExecutor(max_workers=workers)
+            task = lambda start, end: self.__search_batch(documents[start:end], _ScanState())
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                           initializer=_init_parallel_worker,
+                                           initargs=((self, documents),))
+            task = _search_document_batch
+
+        result = BatchMatchResult(self.__pattern_table()[0])
+        with executor:
+            futures = [executor.submit(task, start, end) for start, end in bounds]
+            for (start, _), future in zip(bounds, futures):
+                result.extend(future.result(), start)
+        return result
+
+    # REPORTING MODES
+    # The functions below scan the text like search_words but report less,
+    # so they skip building the dictionary of every occurrence.
+
+    # Returns True if any word occurs in text. The scan stops at the first hit.
+    def contains_any(self, text):
+        return self.first_match(text) is not None
+
+    # Returns the (word, start) pair of the first match found, i.e. the
+    # one that ends first, or None. The scan stops there.
+    def first_match(self, text):
+        scan = self.__new_scan()
+        match = self.__first_match(text, scan, True)
+        if self.stats is not None:
+            self.__record('first_match', scan)
+        return match
+
+    # The delta machine only reports once this machine is done with the
+    # text, so each machine gives its own first match. The delta machine
+    # only scans up to the end of the match found here: one of its
+    # matches only comes first if it ends before that.
+    def __first_match(self, text, scan, final):
+        matches = self.__matches(text, scan, final=final, with_delta=False)
+        match = next(matches, None)
+        matches.close()
+        if self.delta is None:
+            return match
+
+        if match is not None:
+            end = match[1] + len(match[0])
+            final = final and end == len(text)
+            text = text[:end]
+        other = self.delta.__first_match(text, self.__delta_scan(scan), final)
+        if other is not None and (match is None or other[1] + len(other[0]) < match[1] + len(match[0])):
+            return other
+        return match
+
+    # Returns a dictionary with the number of occurrences of each word
+    # (wildcard words are counted under the word, not the matched text).
+    # Words that do not occur are left out. No list of offsets is made.
+    def count_words(self, text):
+        counts = Counter()
+        scan = self.__new_scan()
+        for word, _ in self.__matches(text, scan, keys=False, final=True):
+            counts[word] += 1
+        if self.stats is not None:
+            self.__record('count_words', scan)
+        return dict(counts)
+
+    # Returns the leftmost-longest non-overlapping matches as a list of
+    # (word, start) pairs in text order, e.g. for redaction: the match
+    # starting first wins, the longest one if several start there, and the
+    # scan continues after it.
+    # Matches arrive in the order of their end. Any match still to come
+    # starts at least max_word_length - 1 characters before its end, so a
+    # candidate starting before that is final and is taken right away.
+    # Only the candidates of the last max_word_length characters are kept.
+    def search_longest(self, text):
+        result = []
+        candidates = []
+        taken_end = 0
+        length = self.max_word_length
+
+        # Chooses the leftmost-longest candidate starting before limit
+        def take(limit):
+            nonlocal candidates, taken_end
+            while candidates:
+                start, end, word = min(candidates, key=lambda candidate: (candidate[0], -candidate[1]))
+                if start >= limit:
+                    break
+                result.append((word, start))
+                taken_end = end
+                candidates = [candidate for candidate in candidates if candidate[0] >= end]
+
+        scan = self.__new_scan()
+        matches = self.__matches(text, scan, final=True)
+        if self.delta is not None:
+            # The delta machine reports after the main one
+            matches = sorted(matches, key=lambda match: match[1] + len(match[0]))
+        for word, start in matches:
+            end = start + len(word)
+            take(end - length)
+            if start >= taken_end:
+                candidates.append((start, end, word))
+        take(float('inf'))
+
+        if self.stats is not None:
+            self.__record('search_longest', scan)
+        return result
+
+    # Streaming version of search_words.
+    # chunks is any iterable of strings (lines of a file, blocks read from a
+    # socket, ...). The machine state is carried from one chunk to the next,
+    # so words that cross a chunk boundary are still found.
+    # Yields (word, start) pairs, where word is the key search_words would
+    # use and start is the offset from the beginning of the whole stream.
+    def search_stream(self, chunks):
+        scan = self.__new_scan()
+        try:
+            for chunk in chunks:
+                yield from self.__matches(chunk, scan)
+
+            # The end of the stream ends the words of the last chunk
+            yield from self.__matches(self.wildcard[:0], scan, final=True)
+        finally:
+            if self.stats is not None:
+                self.__record('search_stream', scan)
+
+    # Runs search_stream over a text file, reading chunk_size characters
+    # at a time, so the file never has to be held in memory as a whole.
+    # A machine built from bytes words reads the file in binary mode.
+    def search_file(self, path, chunk_size=1 << 20, encoding='utf-8'):
+        if self.binary:
+            file = open(path, 'rb')
+        else:
+            # newline='' keeps \r\n as it is, so offsets count every
+            # character of the file
+            file = open(path, encoding=encoding, newline='')
+        with file:
+            yield from self.search_stream(iter(lambda: file.read(chunk_size), file.read(0)))
+
+    # Parallel version of search_words for large texts.
+    # The text is split into chunks of chunk_size characters which are
+    # searched by a pool of worker processes (os.cpu_count() by default).
+    # Each chunk is padded with the next max_word_length characters, so a
+    # word crossing into the next chunk is still found (with the character
+    # after it, which whole_words checks like the one before the chunk),
+    # and a match is only kept by the chunk in which it starts. The result
+    # is the same as search_words(text).
+    # Statistics are not recorded, the scans run in other processes.
+    def search_parallel(self, text, workers=None, chunk_size=None):
+        workers = workers or os.cpu_count() or 1
+        if chunk_size is None:
+            chunk_size = max(len(text) // (workers * 4), 1 << 16)
+        if workers == 1 or len(text) <= chunk_size:
+            return self.search_words(text)
+
+        bounds = [(start, min(start + chunk_size, len(text)))
+                  for start in range(0, len(text), chunk_size)]
+        return self.__search_chunks(_search_text_chunk, text, bounds, workers)
+
+    # Parallel search of a UTF-8 text file (or of any file, in bytes,
+    # for a machine built from bytes words).
+    # The file is memory-mapped by each worker, which decodes and searches
+    # its own byte range (about chunk_size bytes, moved forward to the next
+    # character boundary). Offsets are character offsets, as for search_file.
+    def search_file_parallel(self, path, workers=None, chunk_size=1 << 24):
+        workers = workers or os.cpu_count() or 1
+        size = os.path.getsize(path)
+        if size == 0:
+            return defaultdict(list)
+
+        bounds = []
+        with open(path, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = min(start + chunk_size, size)
+                if not self.binary:
+                    end = _utf8_boundary(data, end)
+                bounds.append((start, end))
+                start = end
+        return self.__search_chunks(_search_file_chunk, path, bounds, workers)
+
+    # Runs task over every (start, end) range of source on a process pool
+    # and merges the matches of the chunks in order.
+    # The matcher and the source are handed to each worker once, when the
+    # pool starts. With the fork start method they are simply inherited
+    # by the child processes and never pickled.
+    def __search_chunks(self, task, source, bounds, workers):
+        result = defaultdict(list)
+        with ProcessPoolExecutor(max_workers=min(workers, len(bounds)), mp_context=_pool_context(),
+                                 initializer=_init_parallel_worker,
+                                 initargs=((self, source),)) as pool:
+            futures = [pool.submit(task, start, end) for start, end in bounds]
+
+            # Chunk results are relative to the chunk, add up the
+            # chunk lengths to get the offset in the whole text.
+            offset = 0
+            for future in futures:
+                length, matches = future.result()
+                for word, start in matches:
+                    result[word].append(offset + start)
+                offset += length
+        return result
+
+    # Searches one chunk of text with the machine and its delta machine.
+    # Yields (word, start) pairs, the word being the key of search_words:
+    # the word itself, or the matched text for a wildcard word.
+    # Without keys the word is the (wildcard) word searched for, so
+    # no string is made for a wildcard match.
+    def __matches(self, text, scan, keys=True, final=False, with_delta=True):
+        removed = self.removed
+        num_words = len(self.words)
+        pattern_hits = scan.pattern_hits
+        patterns = self.pattern_words
+        for pattern, start in self.__scan(text, scan, final):
+            if removed and pattern in removed: continue
+            if pattern_hits is not None:
+                pattern_hits[pattern] += 1
+            if not keys:
+                yield patterns[pattern], start
+            elif pattern < num_words:
+                yield self.words[pattern], start
+            else:
+                position = start - scan.base
+                word = scan.window[position:position + len(self.wildcardWords[pattern - num_words])]
+                yield word.lower() if self.ignore_case else word, start
+
+        if with_delta and self.delta is not None:
+            yield from self.delta.__matches(text, self.__delta_scan(scan), keys, final)
+
+    # Like __matches but yields (pattern id, start) pairs, the ids of the
+    # delta machine following those of this machine (see __pattern_table).
+    def __pattern_ids(self, text, scan, first=0, final=False):
+        removed = self.removed
+        pattern_hits = scan.pattern_hits
+        for pattern, start in self.__scan(text, scan, final):
+            if removed and pattern in removed: continue
+            if pattern_hits is not None:
+                pattern_hits[pattern] += 1
+            yield first + pattern, start
+
+        if self.delta is not None:
+            yield from self.delta.__pattern_ids(text, self.__delta_scan(scan),
+                                                first + len(self.words) + len(self.wildcardWords), final)
+
+    # Returns the scan state of the delta machine, starting it if needed.
+    def __delta_scan(self, scan):
+        if scan.delta is None:
+            scan.delta = _ScanState()
+            if scan.pattern_hits is not None:
+                scan.delta.pattern_hits = Counter()
+        return scan.delta
+
+    # Returns the pattern of every id __pattern_ids can yield (the words,
+    # the wildcard words, then those of the delta machine) and their lengths.
+    # Removed words keep their id. Made again only after an add / remove;
+    # the lists are shared by the results, so they are never changed.
+    def __pattern_table(self):
+        if self.pattern_table is None:
+            table, lengths = self.pattern_words, self.word_lengths
+            if self.delta is not None:
+                delta_table, delta_lengths = self.delta.__pattern_table()
+                table, lengths = table + delta_table, lengths + delta_lengths
+            self.pattern_table = table, lengths
+        return self.pattern_table
+
+    # Searches one chunk of text, continuing from (and updating) scan.
+    # Yields (pattern id, start) pairs with start relative to the whole stream.
+    # final tells that the text ends with this chunk.
+    def __scan(self, text, scan, final=False):
+        # Plain words need nothing but the transitions and the output lists
+        if not self.wildcardWords and not self.whole_words and self.stats is None:
+            return self.__scan_words(text, scan)
+        return self.__scan_all(text, scan, final)
+
+    # __scan for a machine without wildcard words, whole_words or statistics.
+    # Each character costs one transition and one output_link lookup.
+    def __scan_words(self, text, scan):
+        offset = scan.offset
+        current_state = scan.state
+        goto = self.goto
+        row_base = self.base
+        check = self.check
+        target = self.target
+        fail = self.fail
+        out_start = self.out_start
+        out_words = self.out_words
+        dict_link = self.dict_link
+        output_link = self.output_link
+        width = self.max_characters
+        symbol_class = self.alphabet.get
+        lengths = self.word_lengths
+
+        # The same loop for both storages, so neither tests which one it has
+        # at every character
+        if self.sparse:
+            for i, character in enumerate(text):
+                ch = symbol_class(character, 0)
+                while check[slot := row_base[current_state] + ch] != current_state:
+                    current_state = fail[current_state]
+                current_state = target[slot]
+
+                state = output_link[current_state]
+                if state == -1: continue
+                end = offset + i + 1
+                while state != -1:
+                    for k in range(out_start[state], out_start[state + 1]):
+                        index = out_words[k]
+                        yield index, end - lengths[index]
+                    state = dict_link[state]
+        else:
+            for i, character in enumerate(text):
+                ch = symbol_class(character, 0)
+                while (next_state := goto[current_state * width + ch]) == -1:
+                    current_state = fail[current_state]
+                current_state = next_state
+
+                state = output_link[current_state]
+                if state == -1: continue
+                end = offset + i + 1
+                while state != -1:
+                    for k in range(out_start[state], out_start[state + 1]):
+                        index = out_words[k]
+                        yield index, end - lengths[index]
+                    state = dict_link[state]
+
+        scan.state = current_state
+        scan.offset = offset + len(text)
+
+    # __scan for any machine: wildcard words, whole_words and statistics.
+    def __scan_all(self, text, scan, final):
+        offset = scan.offset
+
+        # Wildcard matches are reported with the matched text as the key.
+        # The end of the previous chunk is kept in scan.tail, so window holds
+        # every character a wildcard match ending in this chunk can use;
+        # window[0] is at position base of the stream.
+        window = scan.tail + text if scan.tail else text
+        base = offset - len(scan.tail)
+        scan.window = window
+        scan.base = base
+        if scan.tags is None:
+            scan.tags = array('q', [-1]) * self.ring_size
+            scan.counts = array('i', [0]) * self.ring_size
+        tags = scan.tags
+        counts = scan.counts
+        pending = scan.pending
+        space = (_byte_whitespace if self.binary else _whitespace).search
+        spans = self.span_whitespace
+
+        # Initialize current_state to where the previous chunk left off
+        current_state = scan.state
+
+        goto = self.goto
+        sparse = self.sparse
+        row_base = self.base
+        check = self.check
+        target = self.target
+        fail = self.fail
+        out_start = self.out_start
+        out_words = self.out_words
+        dict_link = self.dict_link
+        output_link = self.output_link
+        width = self.max_characters
+        symbol_class = self.alphabet.get
+        words = self.words
+        num_words = len(words)
+        piece_word = self.piece_word
+        piece_end = self.piece_end
+        wildcard_pieces = self.wildcard_pieces
+        wildcard_words = self.wildcardWords
+        ring_start = self.ring_start
+
+        # With statistics, fail and piece_word are read through counters:
+        # the loop reads them once per failure transition and once per
+        # wildcard attempt. Every verification calls space, which then
+        # also stands for spans. Without statistics the loop counts nothing.
+        counting = self.stats is not None
+        if counting:
+            fail = _Counted(fail)
+            piece_word = _Counted(piece_word)
+            space = _Counted((lambda *args: None) if spans else space)
+            spans = False
+
+        # Wildcard words made only of wildcards have no piece to look for,
+        # they match every window of their length.
+        blanks = self.blank_words
+
+        # Index in text of the next character with wildcard words to check
+        # (pending ones ending there, or blank ones), -1 if there is none.
+        # Every other character only compares its index with it.
+        if blanks:
+            due = 0
+        else:
+            due = min(pending) - offset if pending else -1
+
+        # No match starts before floor (the start of the document in search_many)
+        floor = scan.floor
+
+        # With whole_words every match is checked against the characters
+        # around it, see __classify_delimiters.
+        bounded = self.whole_words
+        held = scan.held
+        if bounded:
+            is_delimiter = self.__delimiter_test()
+            delimiter_classes = self.delimiter_classes
+            text_end = len(text) - 1
+
+            def delimiter(character):
+                flag = delimiter_classes[symbol_class(character, 0)]
+                return flag == 1 or flag == 2 and is_delimiter(character)
+
+            # Tells if the match of pattern from start up to text[i] is a
+            # whole word. A match ending with the chunk is held (and False
+            # returned) until the next character is known.
+            def whole(pattern, start, i):
+                if start > floor and not delimiter(window[start - 1 - base]):
+                    return False
+                if i < text_end:
+                    return delimiter(text[i + 1])
+                if not final:
+                    held.append((pattern, start))
+                    return False
+                return True
+
+            # Matches held at the end of the previous chunk
+            if held and (text or final):
+                if not text or delimiter(text[0]):
+                    yield from held
+                held.clear()
 
         # Traverse the text through the built machine
         # to find all occurrences of words
-        for i in range(len(text)):
-            current_state = self.__find_next_state(current_state, text[i])
+        for i, character in enumerate(text):
+            ch = symbol_class(character, 0)
+
+            # Find the next state using the goto and failure functions.
+            # If goto is not defined, use failure function.
+            # In compiled mode goto is always defined, so this is
+            # a single table lookup.
+            # With the sparse storage an edge exists if its slot
+            # is checked as belonging to the state.
+            if sparse:
+                while check[slot := row_base[current_state] + ch] != current_state:
+                    current_state = fail[current_state]
+                current_state = target[slot]
+            else:
+                while (next_state := goto[current_state * width + ch]) == -1:
+                    current_state = fail[current_state]
+                current_state = next_state
+
+            if i == due:
+                end = offset + i
+
+                # Wildcard words whose pieces were all found earlier and
+                # whose trailing wildcards end here.
+                for w, start in pending.pop(end, ()):
+                    if spans or not space(window, start - base, end - base + 1):
+                        if bounded and not whole(num_words + w, start, i): continue
+                        yield num_words + w, start
+
+                for w, length in blanks:
+                    start = end - length + 1
+                    if start >= floor and (spans or not space(window, start - base, end - base + 1)):
+                        if bounded and not whole(num_words + w, start, i): continue
+                        yield num_words + w, start
+
+                if blanks:
+                    due = i + 1
+                else:
+                    due = min(pending) - offset if pending else -1
+
+            # Start at the state itself if words end there,
+            # otherwise at the nearest suffix state that has outputs.
+            state = output_link[current_state]
 
             # If match not found, move to next state
-            if self.out[current_state] == 0: continue
+            if state == -1: continue
 
-            # Match found, store the word in result dictionary
-            for j in range(len(self.words)):
-                if (self.out[current_state] & (1 << j)) > 0:
-                    word = self.words[j]
+            # Match found, report every word that ends here,
+            # following the dictionary suffix links
+            end = offset + i
+            while state != -1:
+                for k in range(out_start[state], out_start[state + 1]):
+                    index = out_words[k]
+                    if index < num_words:
+                        # Start index of word is (i-len(word)+1)
+                        start = end - len(words[index]) + 1
+                        if bounded and not whole(index, start, i): continue
+                        yield index, start
+                        continue
 
-                    # Start index of word is (i-len(word)+1)
-                    result[word].append(i - len(word) + 1)
+                    # A piece of a wildcard word was found: count it for
+                    # the position where that wildcard word would start.
+                    piece = index - num_words
+                    w = piece_word[piece]
+                    start = end - piece_end[piece]
+                    if start < floor: continue
+                    length = len(wildcard_words[w])
+                    slot = ring_start[w] + start % length
+                    if tags[slot] != start:
+                        tags[slot] = start
+                        counts[slot] = 0
+                    counts[slot] += 1
+                    if counts[slot] != wildcard_pieces[w]: continue
 
-        # Return the final result dictionary
-        return result
+                    # All pieces are there, the word is matched once the
+                    # text reaches its last character.
+                    last = start + length - 1
+                    if last > end:
+                        pending.setdefault(last, []).append((w, start))
+                        if due == -1 or last - offset < due:
+                            due = last - offset
+                        continue
+                    if spans or not space(window, start - base, end - base + 1):
+                        if bounded and not whole(num_words + w, start, i): continue
+                        yield num_words + w, start
+                state = dict_link[state]
+
+        scan.state = current_state
+        scan.offset = offset + len(text)
+        if counting:
+            scan.fail_transitions += fail.count
+            scan.wildcard_attempts += piece_word.count
+            scan.wildcard_verifications += space.count
+        # whole_words also needs the character before a match
+        keep = max(self.wildcard_length - 1, self.max_word_length if bounded else 0)
+        scan.tail = window[max(len(window) - keep, 0):] if keep > 0 else ''
 
     # This function handles all occurrences of words containing wildcards.
     def findWildcardMatch(self, outputDict, text, pattern):
-        # Replace our wildcard with regex wildcard
-        subStr = pattern.replace(self.wildcard, ".")
-
-        # Compile wildcard word to regex
-        regexPat = regex.compile(subStr)
-        
-        # Use re.finditer() to get match and indices
-        for match in regex.finditer(regexPat, text.lower(), overlapped=True):
-            # Remove any matches with spaces
-            if bool(regex.search(r"\s", match.group())):
-                continue
-                
-            start = match.start()
-            end = match.end()
-            outputDict[text[start:end]].append(start)
-    
+        for _, start in AhoCorasick([pattern]).search_stream([text]):
+            outputDict[text[start:start + len(pattern)]].append(start)
+
+
+# Matcher and text (file path, or documents) of the running parallel search,
+# set once in every worker process by _init_parallel_worker.
+_parallel_job = None
+
+
+def _init_parallel_worker(job):
+    global _parallel_job
+    _parallel_job = job
+
+
+# Multiprocessing context of the worker pools: fork where it exists.
+def _pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+# Searches documents[start:end] in a worker process (see search_many).
+def _search_document_batch(start, end):
+    matcher, documents = _parallel_job
+    return matcher.search_many(documents[start:end])
+
+
+# Searches text[start:end] plus its padding (and the character before it)
+# in a worker process.
+# Returns the chunk length and the matches that start inside the chunk,
+# with offsets relative to the chunk.
+def _search_text_chunk(start, end):
+    matcher, text = _parallel_job
+    context = 1 if start > 0 else 0
+    window = text[start - context:end + matcher.max_word_length]
+    return end - start, [(word, i - context) for word, i in matcher.search_stream([window])
+                         if context <= i < end - start + context]
+
+
+# Same as _search_text_chunk for the byte range [start, end) of a
+# memory-mapped UTF-8 file. The padding is read from the following bytes,
+# the character before the chunk from the previous ones.
+def _search_file_chunk(start, end):
+    matcher, path = _parallel_job
+    pad = matcher.max_word_length
+    with open(path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        first = max(start - 1, 0)
+        if matcher.binary:
+            context = data[first:start]
+            chunk = data[start:end]
+            padding = data[end:end + pad]
+        else:
+            while first > 0 and data[first] & 0xC0 == 0x80:
+                first -= 1
+            context = data[first:start].decode('utf-8')
+            chunk = data[start:end].decode('utf-8')
+            padding = data[end:_utf8_boundary(data, min(end + 4 * pad, len(data)))].decode('utf-8')
+    window = context + chunk + padding[:pad]
+    return len(chunk), [(word, i - len(context)) for word, i in matcher.search_stream([window])
+                        if len(context) <= i < len(context) + len(chunk)]
+
+
+# Moves a byte position forward to the start of the next UTF-8 character.
+def _utf8_boundary(data, position):
+    while position < len(data) and data[position] & 0xC0 == 0x80:
+        position += 1
+    return position
+
+
+# STATISTICS OF A MACHINE
+# build holds the seconds spent in each build phase ('prepare': splitting
+# the words and making the alphabet, 'trie', 'outputs', 'failure'), the
+# number of states and the table size in bytes.
+# Every search_words / search_stream call makes a record with its method,
+# seconds, characters scanned, failure transitions followed, hits, hits per
+# pattern, and wildcard attempts (pieces counted) and verifications
+# (complete wildcard matches checked). last is the latest record, totals
+# sums the counters over all calls, and callback (if set) is called with
+# each record, e.g. to send it to a metrics pipeline.
+class MatcherStats:
+    def __init__(self, callback=None):
+        self.build = {'seconds': {}, 'states': 0, 'table_bytes': 0}
+        self.calls = 0
+        self.last = None
+        self.totals = {'seconds': 0.0, 'characters': 0, 'fail_transitions': 0, 'hits': 0,
+                       'wildcard_attempts': 0, 'wildcard_verifications': 0, 'pattern_hits': Counter()}
+        self.callback = callback
+        self.__phase = None
+        self.__started = 0.0
+
+    # Ends the current build phase (if any) and starts the given one.
+    def phase(self, name):
+        now = time.perf_counter()
+        if self.__phase is not None:
+            seconds = self.build['seconds']
+            seconds[self.__phase] = seconds.get(self.__phase, 0.0) + now - self.__started
+        self.__phase = name
+        self.__started = now
+
+    def record(self, record):
+        self.calls += 1
+        self.last = record
+        for key, value in record.items():
+            if key in self.totals:
+                self.totals[key] += Counter(value) if key == 'pattern_hits' else value
+        if self.callback is not None:
+            self.callback(record)
+
+    def as_dict(self):
+        totals = dict(self.totals, pattern_hits=dict(self.totals['pattern_hits']))
+        return {'build': self.build, 'calls': self.calls, 'last': self.last, 'totals': totals}
+
+    def to_json(self):
+        return json.dumps(self.as_dict())
+
+
+# Header of a saved machine: magic, byte order, compiled, bytes, ignore_case,
+# sparse, whole_words and span_whitespace flags, then the number of states,
+# the table width, the numbers of words, wildcard words, pieces and outputs,
+# max_states, ring_size, wildcard_length, max_word_length, the number of
+# slots of the sparse storage, the number of symbols of the alphabet (case
+# forms included) and the byte length of the delimiters (-1 without
+# delimiters).
+_MAGIC = b'ACv6'
+_HEADER = struct.Struct('=4sc??????13i')
+
+# Tables written by save(), in file order.
+_TABLES = ('goto', 'base', 'check', 'target', 'fail', 'dict_link', 'output_link', 'out_start', 'out_words',
+           'piece_word', 'piece_end', 'wildcard_pieces', 'ring_start')
+
+# Largest dense goto table (in entries) built when no storage is given,
+# and the depth up to which a compiled sparse machine has full rows.
+_DENSE_LIMIT = 1 << 24
+_DENSE_DEPTH = 2
+
+# Failed first fits after which a slot is no longer tried for the first
+# edge of a row of the sparse storage
+_PLACEMENT_TRIES = 16
+
+# Smallest dense machine whose failure function is built with numpy
+_NUMPY_MIN_STATES = 1 << 12
+
+
+# Returns the other characters (or byte values) whose lowercase form is
+# the given lowercase character, e.g. 'K' and the Kelvin sign for 'k':
+# every character that lowercasing the text would have turned into it.
+# These are its upper and title case forms (when lowercasing them gives
+# the character back) and the few characters of _LOWERCASE_SOURCES.
+# A character whose lowercase form is longer than one character (only
+# U+0130) is not folded, and a capital sigma always folds to σ, where
+# lowercasing a whole text turns a word-final one into ς.
+def _case_forms(character, binary):
+    if binary:
+        other = bytes([character]).upper()[0]
+        return [other] if other != character else []
+    forms = []
+    for other in (character.upper(), character.title()):
+        if len(other) == 1 and other != character and other.lower() == character and other not in forms:
+            forms.append(other)
+    return forms + _LOWERCASE_SOURCES.get(character, [])
+
+
+# The characters whose lowercase form is not given back by upper() or
+# title() of that form (the signs that share it with a letter, and the
+# capital letters whose lowercase letter has another upper case form).
+_LOWERCASE_SOURCES = {
+    'k': ['\u212a'],  # KELVIN SIGN
+    '\u00e5': ['\u212b'],  # ANGSTROM SIGN
+    '\u03c9': ['\u2126'],  # OHM SIGN
+    '\u03b8': ['\u03f4'],  # GREEK CAPITAL THETA SYMBOL
+    '\u00df': ['\u1e9e'],  # LATIN CAPITAL LETTER SHARP S
+}
+
+
+# Wildcard matches that span whitespace are not reported.
+_whitespace = regex.compile(r"\s")
+_byte_whitespace = regex.compile(rb"\s")
+
+
+# The default delimiters of whole_words: everything but letters,
+# digits and the underscore (what \W matches).
+def _is_word_delimiter(character):
+    return not (character.isalnum() or character == '_')
+
+
+_BYTE_DELIMITERS = frozenset(byte for byte in range(256) if not (bytes([byte]).isalnum() or byte == 95))
+
+
+# Where a streaming search is: the machine state reached so far, the
+# offset of the next character in the stream, the last characters seen
+# (the text of wildcard matches that cross a chunk boundary), the
+# wildcard counters, the scan of the delta machine, and the counters
+# reported to MatcherStats.
+# tags / counts are the counter rings of the wildcard words: slot
+# ring_start[w] + start % len(word) counts the pieces of word w found for
+# the start position stored in its tag. pending maps an end position to the
+# (word, start) pairs that are complete once the text gets there.
+# search_many runs one scan over all its documents: each document restarts
+# the machine and moves floor to its first position, so the counter rings
+# are reused without being cleared. held keeps the whole_words matches
+# ending at the last character of a chunk until the next character is seen.
+class _ScanState:
+    def __init__(self):
+        self.state = 0
+        self.offset = 0
+        self.tail = ''
+        self.tags = None
+        self.counts = None
+        self.pending = {}
+        self.window = ''
+        self.base = 0
+        self.delta = None
+        self.fail_transitions = 0
+        self.wildcard_attempts = 0
+        self.wildcard_verifications = 0
+        self.pattern_hits = None
+        self.started = 0
+        self.floor = 0
+        self.held = []
+
+
+# A table (or a function) whose lookups (or calls) are counted, see the
+# statistics of AhoCorasick.__scan_all.
+class _Counted:
+    __slots__ = ('lookup', 'count')
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.count = 0
+
+    def __getitem__(self, key):
+        self.count += 1
+        return self.lookup[key]
+
+    def __call__(self, *args):
+        self.count += 1
+        return self.lookup(*args)
+
+
 def outputTestCase(text, words, caseString, expectedOutput):
         case = "\n\n== {caseString} ".format(caseString=caseString)
         case = case.ljust(85,"=")
@@ -257,6 +1877,20 @@ def outputTestCase(text, words, caseString, expectedOutput):
         print("\n > Expected:")
         print(expectedOutput)
 
+        # Streaming the text one character per chunk must find the same
+        # matches, including the wildcard matches that cross the chunks.
+        streamed = defaultdict(list)
+        for word, start in aho_chorasick.search_stream(text):
+            streamed[word].append(start)
+        print("\n > Streamed one character at a time:", "same" if streamed == result else "DIFFERENT")
+
+        # The sparse storage must find the same matches as the dense one,
+        # compiled or not.
+        same = all(AhoCorasick(words, compiled=compiled, storage='sparse').search_words(text)
+                   == AhoCorasick(words, compiled=compiled, storage='dense').search_words(text)
+                   for compiled in (False, True))
+        print(" > Sparse storage:", "same" if same else "DIFFERENT")
+
 # Driver code
 if __name__ == "__main__":
     caseList = ["Sample Test Case", "Test Case: Wildcards at Beginning / End of Search Words", "Test Case: Capitalization", "Test Case: Word Overlap"]
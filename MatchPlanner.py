@@ -0,0 +1,147 @@
+#############################################################################
+# Chooses how to search for a set of patterns.
+#
+# Each backend is fastest on different pattern sets:
+#   regex       - one compiled regex per pattern, run in C. The best for a
+#                 handful of patterns, as every pattern is a separate pass
+#                 over the text.
+#   ShiftOr     - the bit-parallel matcher of ShiftOr.py, one pass for all
+#                 its patterns, whose cost per character grows with their
+#                 total length. The best for short wildcard patterns, which
+#                 the automaton can only find piece by piece.
+#   AhoCorasick - the AhoCorasick_v2 machine, whose cost per character
+#                 hardly depends on the number of patterns. The best for
+#                 long patterns and for large sets of plain words.
+#
+# The patterns are split into groups by length and wildcards (see
+# MatchPlanner.__init__), every group gets a backend, and search_words
+# merges the results of the groups, which are the same as those of
+# AhoCorasick_v2.AhoCorasick(words).search_words(text).
+#
+# Usage:
+#   planner = MatchPlanner(['h*s', 'p**t', '**ing', 'hers'])
+#   planner.groups      # [(backend name, words, matcher), ...]
+#   planner.search_words(text)
+#############################################################################
+
+from collections import defaultdict
+
+import regex
+
+from AhoCorasick_v2 import AhoCorasick, _case_forms, _byte_whitespace, _whitespace
+from ShiftOr import ShiftOr
+
+# A group of at most this many patterns is searched with regex
+REGEX_MAX_PATTERNS = 12
+
+# Longest pattern given to ShiftOr, and the largest total length of the
+# plain words it also takes (beyond that they go to the automaton)
+SHIFT_OR_MAX_LENGTH = 64
+SHIFT_OR_MAX_BITS = 2048
+
+
+class MatchPlanner:
+    def __init__(self, words, ignore_case=True):
+        self.ignore_case = ignore_case
+        words = [word for word in words if word]
+        binary = bool(words) and isinstance(words[0], bytes)
+        wildcard = b'*' if binary else '*'
+
+        # Short wildcard words always go to ShiftOr, short plain words too
+        # if they fit in SHIFT_OR_MAX_BITS along with them, the rest to
+        # the automaton. Groups small enough for regex are then moved there.
+        if len(words) <= REGEX_MAX_PATTERNS:
+            plan = [('regex', words)]
+        else:
+            short = [word for word in words if len(word) <= SHIFT_OR_MAX_LENGTH]
+            shift = [word for word in short if wildcard in word]
+            plain = [word for word in short if wildcard not in word]
+            if sum(len(word) for word in short) <= SHIFT_OR_MAX_BITS:
+                shift = short
+                plain = []
+            automaton = [word for word in words if len(word) > SHIFT_OR_MAX_LENGTH] + plain
+            plan = [('ShiftOr', shift), ('AhoCorasick', automaton)]
+
+        self.groups = []
+        for backend, group in plan:
+            if not group: continue
+            if len(group) <= REGEX_MAX_PATTERNS:
+                backend = 'regex'
+            self.groups.append((backend, group, self.__build(backend, group)))
+
+    def __build(self, backend, words):
+        if backend == 'regex':
+            return _RegexGroup(words, self.ignore_case)
+        if backend == 'ShiftOr':
+            return ShiftOr(words, self.ignore_case)
+        return AhoCorasick(list(words), ignore_case=self.ignore_case)
+
+    # Finds all occurrences of all words in text with every group,
+    # returning the dictionary of AhoCorasick_v2.search_words.
+    def search_words(self, text):
+        if len(self.groups) == 1:
+            return self.groups[0][2].search_words(text)
+
+        # A key may come from several groups (a word and a wildcard
+        # word matching the same text), its starts are merged in order.
+        result = defaultdict(list)
+        for _, _, matcher in self.groups:
+            for word, starts in matcher.search_words(text).items():
+                result[word].extend(starts)
+        for starts in result.values():
+            starts.sort()
+        return result
+
+
+# Searches for a few patterns with one regex each. The overlapped search
+# of the regex module finds the matches at every start. A wildcard is \S,
+# and with ignore_case each character matches its case forms only, as in
+# AhoCorasick_v2.
+class _RegexGroup:
+    def __init__(self, words, ignore_case):
+        self.ignore_case = ignore_case
+        self.words = [word.lower() for word in words] if ignore_case else list(words)
+        binary = bool(self.words) and isinstance(self.words[0], bytes)
+        space = _byte_whitespace if binary else _whitespace
+
+        # (word, compiled pattern, whether the key is the matched text);
+        # a wildcard word with whitespace of its own never matches
+        wildcard = b'*' if binary else '*'
+        self.patterns = []
+        for word in self.words:
+            if wildcard in word and space.search(word): continue
+            pattern = word[:0].join(_character_pattern(word[j:j + 1], binary, ignore_case)
+                                    for j in range(len(word)))
+            self.patterns.append((word, regex.compile(pattern), wildcard in word))
+
+    def search_words(self, text):
+        result = defaultdict(list)
+        for word, pattern, keyed in self.patterns:
+            if keyed:
+                for match in pattern.finditer(text, overlapped=True):
+                    key = match.group()
+                    result[key.lower() if self.ignore_case else key].append(match.start())
+            else:
+                for match in pattern.finditer(text, overlapped=True):
+                    result[word].append(match.start())
+
+        # Several patterns may give the same key
+        if len(self.patterns) > 1:
+            for starts in result.values():
+                starts.sort()
+        return result
+
+
+# Returns the regex matching one character of a word (a str or bytes
+# of length 1).
+def _character_pattern(character, binary, ignore_case):
+    if character == (b'*' if binary else '*'):
+        return rb'\S' if binary else r'\S'
+    forms = [character]
+    if ignore_case:
+        symbol = character[0] if binary else character
+        forms += [bytes([other]) if binary else other for other in _case_forms(symbol, binary)]
+    if len(forms) == 1:
+        return regex.escape(character)
+    opening, closing = (b'[', b']') if binary else ('[', ']')
+    return opening + character[:0].join(map(regex.escape, forms)) + closing
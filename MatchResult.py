@@ -0,0 +1,135 @@
+#############################################################################
+# Compact, column-oriented result of a search.
+#
+# Instead of a dictionary of lists keyed by the matched text, every match
+# is one row of three parallel typed arrays: the id of the pattern that
+# matched, and the start and end (exclusive) offsets in the text. A row
+# takes 20 bytes and no Python object is made per match. Grouping by
+# pattern and the matched strings are only computed when asked for.
+#############################################################################
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+# numpy is optional, it is only needed by MatchResult.to_numpy()
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class MatchResult:
+    def __init__(self, patterns):
+        # patterns[i] is the pattern (word or wildcard word) with id i
+        self.patterns = patterns
+
+        # The columns: pattern ids as 32-bit ints, offsets as 64-bit ints
+        self.pattern_id = array('i')
+        self.start = array('q')
+        self.end = array('q')
+
+        # Filled by group_by_pattern() on first use
+        self._groups = None
+
+    def append(self, pattern, start, end):
+        self.pattern_id.append(pattern)
+        self.start.append(start)
+        self.end.append(end)
+        self._groups = None
+
+    def __len__(self):
+        return len(self.start)
+
+    # Rows are (pattern id, start, end) tuples
+    def __getitem__(self, index):
+        return self.pattern_id[index], self.start[index], self.end[index]
+
+    def __iter__(self):
+        return zip(self.pattern_id, self.start, self.end)
+
+    # Number of bytes used by the columns
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in (self.pattern_id, self.start, self.end))
+
+    # Returns a dictionary from pattern to the array of its start offsets,
+    # computed on the first call. Ids of the same pattern (one added twice)
+    # share one entry.
+    def group_by_pattern(self):
+        if self._groups is None:
+            groups = {}
+            patterns = self.patterns
+            for pattern, start in zip(self.pattern_id, self.start):
+                pattern = patterns[pattern]
+                starts = groups.get(pattern)
+                if starts is None:
+                    starts = groups[pattern] = array('q')
+                starts.append(start)
+            self._groups = groups
+        return self._groups
+
+    # Returns the number of matches, of one pattern if given.
+    def count(self, pattern=None):
+        if pattern is None:
+            return len(self)
+        starts = self.group_by_pattern().get(pattern)
+        return len(starts) if starts is not None else 0
+
+    # Yields the matched text of every row, text being the searched text.
+    def strings(self, text):
+        for start, end in zip(self.start, self.end):
+            yield text[start:end]
+
+    # Returns the columns as numpy arrays sharing memory with the result
+    # (so the result must not be appended to while they are in use).
+    def to_numpy(self):
+        if numpy is None:
+            raise ImportError("MatchResult.to_numpy() requires numpy")
+        return {'pattern_id': numpy.frombuffer(self.pattern_id, dtype=numpy.int32),
+                'start': numpy.frombuffer(self.start, dtype=numpy.int64),
+                'end': numpy.frombuffer(self.end, dtype=numpy.int64)}
+
+
+# Result of search_many: the same columns plus the index of the document
+# each match is in. Rows are (document, pattern id, start, end) tuples,
+# ordered by document, with offsets relative to the document.
+class BatchMatchResult(MatchResult):
+    def __init__(self, patterns):
+        super().__init__(patterns)
+        self.document = array('q')
+
+    def append(self, document, pattern, start, end):
+        self.document.append(document)
+        super().append(pattern, start, end)
+
+    # Appends the rows of other, adding first to its document indexes.
+    def extend(self, other, first=0):
+        self.document.extend(document + first for document in other.document)
+        self.pattern_id.extend(other.pattern_id)
+        self.start.extend(other.start)
+        self.end.extend(other.end)
+        self._groups = None
+
+    def __getitem__(self, index):
+        return (self.document[index],) + super().__getitem__(index)
+
+    def __iter__(self):
+        return zip(self.document, self.pattern_id, self.start, self.end)
+
+    def nbytes(self):
+        return super().nbytes() + self.document.itemsize * len(self.document)
+
+    # Returns the (pattern id, start, end) rows of one document.
+    def rows(self, document):
+        first = bisect_left(self.document, document)
+        last = bisect_right(self.document, document, first)
+        return list(zip(self.pattern_id[first:last], self.start[first:last], self.end[first:last]))
+
+    # Yields the matched text of every row, documents being the searched documents.
+    def strings(self, documents):
+        for document, start, end in zip(self.document, self.start, self.end):
+            yield documents[document][start:end]
+
+    def to_numpy(self):
+        columns = super().to_numpy()
+        columns['document'] = numpy.frombuffer(self.document, dtype=numpy.int64)
+        return columns
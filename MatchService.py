@@ -0,0 +1,390 @@
+#############################################################################
+# Local matching service.
+#
+# Holds built AhoCorasick_v2 machines keyed by a pattern set id and answers
+# search requests over a Unix socket (or a localhost TCP port), so the
+# processes of a host share one build of each pattern set instead of each
+# building their own.
+#
+# The protocol is one JSON object per line in each direction. Requests:
+#   {"id": 1, "op": "load", "set": "spam", "patterns": [...],
+#    "compiled": false, "ignore_case": true}
+#   {"id": 2, "op": "search", "set": "spam", "text": "..."}
+#   {"id": 3, "op": "drop", "set": "spam"}
+#   {"id": 4, "op": "sets"}
+#   {"id": 5, "op": "stats"}
+# Every request gets one response with the same id:
+#   {"id": 2, "result": {"word": [start, ...], ...}, "seconds": 0.0012}
+#   {"id": 3, "error": "unknown pattern set 'spam'"}
+# The search result is that of search_words. seconds is the latency of the
+# request, from the moment it is read to the moment its response is ready.
+#
+# Requests are pipelined: a client may send many requests without waiting,
+# they run concurrently and responses are written as soon as they are ready,
+# so they may come back in a different order (match them by id).
+#
+# Scans run in a worker pool so the event loop keeps reading requests. With
+# the default process pool every machine is saved to a file in directory and
+# memory-mapped by the workers (see AhoCorasick.load), so all of them share
+# one copy of its tables. A thread pool avoids the files but its scans
+# share the GIL.
+#
+# Usage:
+#   python MatchService.py --socket /tmp/match.sock --load spam=spam.txt
+#############################################################################
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from AhoCorasick_v2 import AhoCorasick, _pool_context
+
+
+class MatchService:
+    def __init__(self, workers=None, pool='process', directory=None, max_pending=64,
+                 max_request=1 << 26):
+        if pool not in ('process', 'thread'):
+            raise ValueError("pool must be 'process' or 'thread', not {pool!r}".format(pool=pool))
+        self.pool = pool
+        workers = workers or os.cpu_count() or 1
+        if pool == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # Saved machines of the process pool, in a temporary directory
+        # unless one is given (which is then left in place on close).
+        self.directory = directory
+        self.temporary = None
+        if pool == 'process' and directory is None:
+            self.temporary = self.directory = tempfile.mkdtemp(prefix='match-service-')
+
+        # Pattern set id -> machine (memory-mapped with the process pool)
+        self.sets = {}
+        self.version = 0
+
+        # Searches running on each saved machine; the file of a dropped
+        # machine is only removed once none are left.
+        self.running = Counter()
+        self.dropped = set()
+
+        # Requests of a connection that may run at the same time;
+        # the connection is not read further until one of them is done.
+        self.max_pending = max_pending
+        # Longest request line, in bytes
+        self.max_request = max_request
+
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.servers = []
+        self.connections = {}
+
+    # Builds the machine of a pattern set, replacing the one with that id.
+    # Returns the number of states of the machine.
+    # The build runs in the worker pool like the searches, so a large
+    # pattern set does not hold up the other requests.
+    async def load(self, set_id, patterns, compiled=False, ignore_case=True):
+        loop = asyncio.get_running_loop()
+        patterns = list(patterns)
+        if self.pool == 'process':
+            # A new file per version, workers may still be using the old one
+            self.version += 1
+            path = os.path.join(self.directory, '{version}.acv2'.format(version=self.version))
+            try:
+                await loop.run_in_executor(self.executor, _build, patterns, compiled, ignore_case, path)
+            except BaseException:
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+            matcher = AhoCorasick.load(path)
+        else:
+            matcher = await loop.run_in_executor(self.executor, _build, patterns, compiled, ignore_case)
+        self.drop(set_id)
+        self.sets[set_id] = matcher
+        return matcher.states_count
+
+    # Forgets a pattern set (if there is one with that id).
+    def drop(self, set_id):
+        matcher = self.sets.pop(set_id, None)
+        if matcher is not None and matcher.source:
+            self.dropped.add(matcher.source)
+            self.__remove_dropped()
+
+    def __remove_dropped(self):
+        for path in [path for path in self.dropped if not self.running[path]]:
+            self.dropped.discard(path)
+            del self.running[path]
+            os.remove(path)
+
+    # Searches text with the machine of a pattern set in the worker pool.
+    # Returns the search_words result as a plain dictionary.
+    async def search(self, set_id, text):
+        matcher = self.sets.get(set_id)
+        if matcher is None:
+            raise KeyError("unknown pattern set {set_id!r}".format(set_id=set_id))
+        loop = asyncio.get_running_loop()
+        if not matcher.source:
+            return await loop.run_in_executor(self.executor, _search, matcher, text)
+
+        path = matcher.source
+        self.running[path] += 1
+        try:
+            return await loop.run_in_executor(self.executor, _search_saved, path, text)
+        finally:
+            self.running[path] -= 1
+            if path in self.dropped:
+                self.__remove_dropped()
+
+    # Answers one request, returns its response.
+    async def handle(self, request):
+        started = time.perf_counter()
+        response = {'id': request.get('id')}
+
+        def field(name):
+            if name not in request:
+                raise KeyError("missing {name!r} in {op!r} request".format(name=name, op=op))
+            return request[name]
+
+        try:
+            op = request.get('op')
+            if op == 'search':
+                response['result'] = await self.search(field('set'), field('text'))
+            elif op == 'load':
+                response['states'] = await self.load(field('set'), field('patterns'),
+                                               compiled=request.get('compiled', False),
+                                               ignore_case=request.get('ignore_case', True))
+            elif op == 'drop':
+                if field('set') not in self.sets:
+                    raise KeyError("unknown pattern set {set_id!r}".format(set_id=request['set']))
+                self.drop(request['set'])
+            elif op == 'sets':
+                response['result'] = sorted(self.sets)
+            elif op == 'stats':
+                response['result'] = self.statistics()
+            else:
+                raise ValueError("unknown op {op!r}".format(op=op))
+        except (KeyError, ValueError, TypeError) as error:
+            self.errors += 1
+            response['error'] = str(error.args[0]) if error.args else repr(error)
+        except Exception as error:
+            # Anything else (e.g. patterns that are not strings) is still
+            # answered, so the client waiting for this id is not left hanging
+            self.errors += 1
+            response['error'] = '{name}: {error}'.format(name=type(error).__name__, error=error)
+        seconds = time.perf_counter() - started
+        self.requests += 1
+        self.seconds += seconds
+        response['seconds'] = seconds
+        return response
+
+    def statistics(self):
+        return {'sets': len(self.sets),
+                'requests': self.requests,
+                'errors': self.errors,
+                'mean_seconds': self.seconds / self.requests if self.requests else 0.0}
+
+    # Serves one client connection: reads requests line by line and
+    # starts each one right away, writing its response when it is done.
+    async def serve_connection(self, reader, writer):
+        pending = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+
+        async def answer(request):
+            try:
+                response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                pending.release()
+
+        self.connections[reader] = writer, asyncio.current_task()
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request is not a JSON object")
+                except ValueError as error:
+                    writer.write(json.dumps({'id': None, 'error': str(error)}).encode() + b'\n')
+                    continue
+                await pending.acquire()
+                task = asyncio.create_task(answer(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except (ConnectionError, ValueError):
+            # Lost connection, or a request longer than max_request
+            pass
+        finally:
+            del self.connections[reader]
+            writer.close()
+
+    async def start_unix(self, path):
+        server = await asyncio.start_unix_server(self.serve_connection, path=path, limit=self.max_request)
+        self.servers.append(server)
+        return server
+
+    async def start_tcp(self, port, host='127.0.0.1'):
+        server = await asyncio.start_server(self.serve_connection, host=host, port=port,
+                                            limit=self.max_request)
+        self.servers.append(server)
+        return server
+
+    # Stops the servers (closing their connections once the requests read
+    # so far are answered) and the worker pool, and removes the saved machines.
+    async def close(self):
+        for server in self.servers:
+            server.close()
+        connections = list(self.connections.items())
+        for reader, (writer, _) in connections:
+            writer.transport.pause_reading()
+            reader.feed_eof()
+        if connections:
+            await asyncio.wait([task for _, (_, task) in connections])
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+        self.executor.shutdown()
+        for set_id in list(self.sets):
+            self.drop(set_id)
+        self.running.clear()
+        self.__remove_dropped()
+        if self.temporary:
+            shutil.rmtree(self.temporary, ignore_errors=True)
+
+
+# Client of a MatchService. Requests may be pipelined: every method can be
+# awaited concurrently over the one connection.
+class MatchClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.waiting = {}
+        self.receiver = asyncio.create_task(self.__receive())
+
+    # max_response is the longest response line, in bytes
+    @classmethod
+    async def connect_unix(cls, path, max_response=1 << 26):
+        return cls(*await asyncio.open_unix_connection(path, limit=max_response))
+
+    @classmethod
+    async def connect_tcp(cls, port, host='127.0.0.1', max_response=1 << 26):
+        return cls(*await asyncio.open_connection(host, port, limit=max_response))
+
+    # Sends a request and returns its response.
+    async def request(self, op, **fields):
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.next_id] = future
+        self.writer.write(json.dumps(dict(fields, id=self.next_id, op=op)).encode() + b'\n')
+        await self.writer.drain()
+        return await future
+
+    # Returns the search_words result of text, raises KeyError on error.
+    async def search(self, set_id, text):
+        response = await self.request('search', set=set_id, text=text)
+        if 'error' in response:
+            raise KeyError(response['error'])
+        return response['result']
+
+    async def load(self, set_id, patterns, compiled=False, ignore_case=True):
+        return await self.request('load', set=set_id, patterns=list(patterns),
+                                  compiled=compiled, ignore_case=ignore_case)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+    # Hands every response to the request waiting for it.
+    async def __receive(self):
+        try:
+            while line := await self.reader.readline():
+                response = json.loads(line)
+                future = self.waiting.pop(response.get('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection to the match service closed"))
+            self.waiting.clear()
+
+
+# Machines loaded by a worker process, by file name.
+_saved_machines = {}
+
+
+# Builds a machine in a worker. With a path (for the process pool) the
+# machine is saved there for the workers to map, and only its number of
+# states is sent back instead of the tables.
+def _build(patterns, compiled, ignore_case, path=None):
+    matcher = AhoCorasick(patterns, compiled=compiled, ignore_case=ignore_case)
+    if path is None:
+        return matcher
+    matcher.save(path)
+    return matcher.states_count
+
+
+def _search(matcher, text):
+    return dict(matcher.search_words(text))
+
+
+# Searches text with a saved machine in a worker process,
+# loading (memory-mapping) it on first use. The machines whose file was
+# removed by the service are forgotten at the same time.
+def _search_saved(path, text):
+    matcher = _saved_machines.get(path)
+    if matcher is None:
+        for saved in [saved for saved in _saved_machines if not os.path.exists(saved)]:
+            del _saved_machines[saved]
+        matcher = _saved_machines[path] = AhoCorasick.load(path)
+    return dict(matcher.search_words(text))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Aho-Corasick searches to local clients.")
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument('--socket', help="path of the Unix socket to listen on")
+    address.add_argument('--port', type=int, help="localhost TCP port to listen on")
+    parser.add_argument('--workers', type=int, default=None, help="size of the worker pool")
+    parser.add_argument('--pool', choices=('process', 'thread'), default='process')
+    parser.add_argument('--directory', default=None, help="where the process pool's machines are saved")
+    parser.add_argument('--load', action='append', default=[], metavar='SET=FILE',
+                        help="pattern set to load at start, one pattern per line of FILE")
+    args = parser.parse_args()
+
+    async def serve():
+        service = MatchService(workers=args.workers, pool=args.pool, directory=args.directory)
+        for argument in args.load:
+            set_id, _, path = argument.partition('=')
+            with open(path, encoding='utf-8') as file:
+                await service.load(set_id, [line.rstrip('\n') for line in file if line.strip()])
+        if args.socket:
+            server = await service.start_unix(args.socket)
+        else:
+            server = await service.start_tcp(args.port)
+        try:
+            await server.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
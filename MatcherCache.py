@@ -0,0 +1,151 @@
+#############################################################################
+# Cache of built AhoCorasick_v2 machines.
+#
+# Building a machine for a word list that was already built is avoided by
+# keeping the machines in a cache keyed by a fingerprint of the normalized
+# word list: the words as the machine sees them (lowercase with
+# ignore_case), in sorted order, plus the options the machine is built
+# with. So ["He", "she"] and ["SHE", "he"] share one machine.
+#
+# The least recently used machines are evicted once their tables take more
+# than max_bytes (see AhoCorasick.table_bytes). With a directory, every
+# machine built is also saved there under its fingerprint, and a machine
+# missing from memory is memory-mapped from its file (see AhoCorasick.load)
+# before building it again, which also shares it between processes.
+#
+# The machines returned are shared by every caller asking for the same
+# words: they are frozen (see AhoCorasick.freeze), so add_pattern and
+# remove_pattern raise ValueError, and their pattern ids follow the sorted
+# order of the words.
+#
+# Usage:
+#   matcher = cached_matcher(words)
+#############################################################################
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from AhoCorasick_v2 import AhoCorasick, _MAGIC
+
+
+class MatcherCache:
+    def __init__(self, max_bytes=64 << 20, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        # fingerprint -> (machine, table bytes when it was added),
+        # least recently used first
+        self.machines = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    # Returns the fingerprint (a hex string) of the machine AhoCorasick(words,
+    # **options) would build, along with the normalized words. Every build
+    # option is part of it, as is the version of the saved file format.
+    @staticmethod
+    def fingerprint(words, compiled=False, ignore_case=True, storage=None, whole_words=False,
+                    delimiters=None, span_whitespace=False):
+        words = [word.lower() for word in words] if ignore_case else list(words)
+        words.sort()
+        binary = bool(words) and isinstance(words[0], bytes)
+        if delimiters is not None:
+            delimiters = sorted(set(delimiters))
+
+        digest = hashlib.sha256()
+        digest.update(('{magic} compiled={compiled} ignore_case={ignore_case} binary={binary} '
+                       'storage={storage} whole_words={whole_words} delimiters={delimiters} '
+                       'span_whitespace={span_whitespace}').format(
+            magic=_MAGIC.decode(), compiled=bool(compiled), ignore_case=bool(ignore_case), binary=binary,
+            storage=storage, whole_words=bool(whole_words), delimiters=delimiters,
+            span_whitespace=bool(span_whitespace)).encode())
+        for word in words:
+            word = word if binary else word.encode('utf-8')
+            digest.update(len(word).to_bytes(8, 'little'))
+            digest.update(word)
+        return digest.hexdigest(), words
+
+    # Returns a built machine for words, from the cache if possible.
+    # The options are those of AhoCorasick (see fingerprint).
+    def get(self, words, compiled=False, ignore_case=True, storage=None, whole_words=False,
+            delimiters=None, span_whitespace=False):
+        options = {'compiled': compiled, 'ignore_case': ignore_case, 'storage': storage,
+                   'whole_words': whole_words, 'delimiters': delimiters,
+                   'span_whitespace': span_whitespace}
+        key, words = self.fingerprint(words, **options)
+        with self.lock:
+            entry = self.machines.get(key)
+            if entry is not None:
+                self.machines.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Built outside the lock, so other word lists are not held up;
+        # two threads missing the same key at once both build it.
+        matcher = self.__load(key)
+        if matcher is None:
+            matcher = AhoCorasick(words, **options)
+            self.__save(key, matcher)
+        matcher.freeze()
+
+        with self.lock:
+            if key in self.machines:
+                return self.machines[key][0]
+            size = matcher.table_bytes()
+            if size <= self.max_bytes:
+                self.machines[key] = (matcher, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    _, (_, evicted_size) = self.machines.popitem(last=False)
+                    self.bytes -= evicted_size
+        return matcher
+
+    # Empties the cache in memory (the files of directory are kept).
+    def clear(self):
+        with self.lock:
+            self.machines.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self.machines)
+
+    def __path(self, key):
+        return os.path.join(self.directory, key + '.acv2')
+
+    def __load(self, key):
+        if self.directory is None or not os.path.exists(self.__path(key)):
+            return None
+        try:
+            matcher = AhoCorasick.load(self.__path(key))
+        except Exception:
+            # Unreadable, corrupt or from another machine: build it again
+            return None
+        self.loads += 1
+        return matcher
+
+    # Saves under a temporary name first, so a process loading the
+    # file never sees it half written.
+    def __save(self, key, matcher):
+        if self.directory is None:
+            return
+        path = self.__path(key)
+        temporary = '{path}.{pid}.{thread}'.format(path=path, pid=os.getpid(), thread=threading.get_ident())
+        matcher.save(temporary)
+        os.replace(temporary, path)
+
+
+# The cache shared by the whole process, used by cached_matcher.
+default_cache = MatcherCache()
+
+
+# Returns AhoCorasick(words, **options) from default_cache.
+def cached_matcher(words, **options):
+    return default_cache.get(words, **options)
@@ -0,0 +1,141 @@
+#############################################################################
+# Bit-parallel matcher for a few short patterns (the Shift-And form of
+# Shift-Or, see Baeza-Yates & Gonnet, "A new approach to text searching").
+#
+# All the patterns are packed side by side into one integer, as in the
+# multi-pattern variant of Wu & Manber: pattern p owns the bits
+# offset[p] ... offset[p] + len(p) - 1, and bit offset[p] + j of the state
+# is set after a character if the last j + 1 characters of the text match
+# the first j + 1 characters of p. Each text character then costs one
+# shift, one or and one and for every pattern at once:
+#
+#   state = ((state << 1) | starts) & masks[character]
+#
+# where starts has the first bit of every pattern set (so no bit carries
+# over from one pattern to the next) and masks[character] has bit
+# offset[p] + j set if character may stand at position j of p. A wildcard
+# (*) position is set in the mask of every character but whitespace, so
+# wildcard words match exactly what AhoCorasick_v2 matches.
+#
+# Python integers have no fixed width, but the state should stay within a
+# few machine words for the scan to be fast: MatchPlanner only hands short
+# pattern groups to this matcher.
+#
+# Usage:
+#   matcher = ShiftOr(['h*s', 'p**t', '**ing'])
+#   matcher.search_words(text)
+#############################################################################
+
+from collections import defaultdict
+
+from AhoCorasick_v2 import _case_forms, _byte_whitespace, _whitespace
+
+
+class ShiftOr:
+    def __init__(self, words, ignore_case=True):
+        # Same conventions as AhoCorasick_v2: words are str or bytes,
+        # lowercase with ignore_case, and a * stands for any single
+        # character that is not whitespace.
+        self.ignore_case = ignore_case
+        self.words = [word.lower() for word in words] if ignore_case else list(words)
+        self.binary = bool(self.words) and isinstance(self.words[0], bytes)
+        wildcard = b'*'[0] if self.binary else '*'
+
+        # Bit layout: offsets and the bit of the last character of each word.
+        # ends maps that bit to the indices of the words ending there
+        # (identical words share their bits).
+        self.starts = 0
+        self.finals = 0
+        self.ends = {}
+        layout = {}
+        positions = defaultdict(int)
+        wildcards = 0
+        self.bits = 0
+        for index, word in enumerate(self.words):
+            # A wildcard match never contains whitespace, so a wildcard
+            # word with whitespace of its own never matches.
+            if not word or wildcard in word and _search_space(self.binary, word): continue
+            if word in layout:
+                self.ends[layout[word]].append(index)
+                continue
+            offset = self.bits
+            for j, character in enumerate(word):
+                if character == wildcard:
+                    wildcards |= 1 << offset + j
+                else:
+                    positions[character] |= 1 << offset + j
+            self.bits += len(word)
+            last = offset + len(word) - 1
+            layout[word] = last
+            self.ends[last] = [index]
+            self.starts |= 1 << offset
+            self.finals |= 1 << last
+
+        # With ignore_case the other case forms of a character
+        # share its positions.
+        if ignore_case:
+            for character, mask in list(positions.items()):
+                for other in _case_forms(character, self.binary):
+                    positions[other] |= mask
+
+        # Masks of the characters of the words and of whitespace; any other
+        # character only matches the wildcard positions (see search_words).
+        self.wildcards = wildcards
+        self.masks = {character: mask | wildcards for character, mask in positions.items()}
+        for character in _BYTE_WHITESPACE if self.binary else _WHITESPACE:
+            self.masks[character] = positions.get(character, 0)
+
+        # Wildcard words are reported with the matched text as the key
+        self.keyed = [wildcard in word for word in self.words]
+
+    # Returns the number of bits of the state (the total length of the words).
+    def __len__(self):
+        return self.bits
+
+    # Finds all occurrences of all words in text, returning the same
+    # dictionary as AhoCorasick_v2.search_words: the key is the word, or the
+    # matched text for a wildcard word, and the value is the list of starts.
+    def search_words(self, text):
+        result = defaultdict(list)
+        words = self.words
+        keyed = self.keyed
+        for index, start in self.search(text):
+            word = words[index]
+            if keyed[index]:
+                word = text[start:start + len(word)]
+                if self.ignore_case:
+                    word = word.lower()
+            result[word].append(start)
+        return result
+
+    # Yields (word index, start) for every match, in the order of their end.
+    def search(self, text):
+        masks = self.masks.get
+        wildcards = self.wildcards
+        starts = self.starts
+        finals = self.finals
+        ends = self.ends
+        words = self.words
+
+        state = 0
+        for i, character in enumerate(text):
+            state = ((state << 1) | starts) & masks(character, wildcards)
+            if not state & finals: continue
+
+            # Report every word whose last bit is set, lowest bit first
+            hits = state & finals
+            while hits:
+                low = hits & -hits
+                for index in ends[low.bit_length() - 1]:
+                    yield index, i - len(words[index]) + 1
+                hits ^= low
+
+
+# The whitespace symbols (as \s sees them) of bytes and str texts.
+# They are all below U+3001.
+_BYTE_WHITESPACE = [byte for byte in range(256) if _byte_whitespace.match(bytes([byte]))]
+_WHITESPACE = [character for character in map(chr, range(0x3001)) if _whitespace.match(character)]
+
+
+def _search_space(binary, word):
+    return (_byte_whitespace if binary else _whitespace).search(word)
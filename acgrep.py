@@ -0,0 +1,201 @@
+#############################################################################
+# grep-like search of files for many patterns at once, with the
+# AhoCorasick_v2 machine.
+#
+# The patterns (one per line of a patterns file, with * as a wildcard for
+# any single character) are built into one machine, and every file is
+# memory-mapped and searched in a single pass, files being spread over a
+# pool of worker processes. Like grep, a match never spans lines.
+#
+# Each match is printed as file:line:column:text (line and column start at
+# 1, the column counts characters). Unlike grep -o, overlapping matches of
+# different patterns are all printed. The file name is left out when a
+# single file is searched.
+#
+# Usage:
+#   python acgrep.py -f patterns.txt logs/ more.log
+#   python acgrep.py -i -c -e 'err*r' -e timeout app.log
+#   python acgrep.py -w -f names.txt docs/
+#
+# Exit status: 0 if a match was found, 1 if none, 2 if a file could not be read.
+#############################################################################
+
+import argparse
+import codecs
+import mmap
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from AhoCorasick_v2 import AhoCorasick, _pool_context
+
+# Files are decoded and searched this many bytes at a time (cut at a line end)
+BLOCK_SIZE = 1 << 24
+
+# Matcher and options of the running search, set once in
+# every worker process by _init_worker.
+_job = None
+
+
+def _init_worker(job):
+    global _job
+    _job = job
+
+
+# Yields the lines of the file at path in blocks, each block being
+# (number of lines before it, list of lines). The file is memory-mapped,
+# and cut at line ends so no multi-byte character is split.
+def _line_blocks(path, encoding):
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            line = 0
+            start = 0
+            while start < len(data):
+                end = data.find(b'\n', min(start + BLOCK_SIZE, len(data)) - 1)
+                end = len(data) if end == -1 else end + 1
+                lines = decoder.decode(data[start:end], final=end == len(data)).split('\n')
+                if lines[-1] == '':
+                    lines.pop()
+                yield line, lines
+                line += len(lines)
+                start = end
+
+
+# Searches one file. Returns (path, output lines, number of matches,
+# error message or None).
+def _grep_file(path):
+    matcher, options = _job
+    output = []
+    matches = 0
+    try:
+        for first, lines in _line_blocks(path, options['encoding']):
+            if options['files_with_matches']:
+                if any(matcher.contains_any(line) for line in lines):
+                    return path, [path], 1, None
+                continue
+
+            result = matcher.search_many(lines)
+            if options['count']:
+                matches += len(set(result.document))
+                continue
+
+            matches += len(result)
+            prefix = path + ':' if options['with_filename'] else ''
+            for line, _, start, end in sorted(result, key=lambda row: (row[0], row[2], row[3])):
+                output.append('{prefix}{line}:{column}:{text}'.format(
+                    prefix=prefix, line=first + line + 1, column=start + 1, text=lines[line][start:end]))
+    except OSError as error:
+        return path, [], 0, error.strerror or str(error)
+
+    if options['count']:
+        output.append('{prefix}{count}'.format(
+            prefix=path + ':' if options['with_filename'] else '', count=matches))
+    elif options['files_with_matches']:
+        output = []
+    return path, output, matches, None
+
+
+# Yields the files to search: the given files, and every file
+# under the given directories (in sorted order).
+def _walk(paths):
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories.sort()
+            for name in sorted(files):
+                yield os.path.join(directory, name)
+
+
+def _read_patterns(args):
+    patterns = list(args.regexp)
+    for path in args.file:
+        with open(path, encoding=args.encoding) as file:
+            patterns.extend(line.rstrip('\r\n') for line in file)
+    return [pattern for pattern in patterns if pattern]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Search files for many fixed patterns (* matches any single character).")
+    parser.add_argument('pattern', nargs='?', help="the pattern, if no -e or -f is given")
+    parser.add_argument('paths', nargs='*', metavar='FILE', help="files or directories to search")
+    parser.add_argument('-e', '--regexp', action='append', default=[], metavar='PATTERN',
+                        help="a pattern to search for (may be repeated)")
+    parser.add_argument('-f', '--file', action='append', default=[], metavar='FILE',
+                        help="read the patterns from FILE, one per line (may be repeated)")
+    parser.add_argument('-i', '--ignore-case', action='store_true', help="ignore case distinctions")
+    parser.add_argument('-w', '--word-regexp', action='store_true',
+                        help="match only whole words (a match must not be next to a letter, digit or _)")
+    parser.add_argument('-c', '--count', action='store_true',
+                        help="print the number of matching lines of each file")
+    parser.add_argument('-l', '--files-with-matches', action='store_true',
+                        help="print only the names of the files with matches")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--encoding', default='utf-8', help="encoding of the files (default: utf-8)")
+    args = parser.parse_args(argv)
+
+    # Without -e / -f the first positional argument is the pattern
+    if (args.regexp or args.file) and args.pattern is not None:
+        args.paths.insert(0, args.pattern)
+    elif args.pattern is not None:
+        args.regexp.append(args.pattern)
+    if not args.paths:
+        parser.error("no file to search")
+
+    try:
+        patterns = _read_patterns(args)
+    except OSError as error:
+        print("acgrep: {error}".format(error=error), file=sys.stderr)
+        return 2
+    if not patterns:
+        parser.error("no pattern to search for")
+
+    matcher = AhoCorasick(patterns, ignore_case=args.ignore_case, whole_words=args.word_regexp)
+    paths = list(_walk(args.paths))
+    options = {'encoding': args.encoding,
+               'count': args.count,
+               'files_with_matches': args.files_with_matches,
+               'with_filename': len(paths) > 1 or any(os.path.isdir(path) for path in args.paths)}
+    job = (matcher, options)
+
+    workers = min(args.jobs or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        _init_worker(job)
+        results = map(_grep_file, paths)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(),
+                                   initializer=_init_worker, initargs=(job,))
+        results = pool.map(_grep_file, paths, chunksize=max(1, len(paths) // (workers * 16)))
+
+    found = False
+    failed = False
+    try:
+        for path, output, matches, error in results:
+            if error is not None:
+                print("acgrep: {path}: {error}".format(path=path, error=error), file=sys.stderr)
+                failed = True
+                continue
+            found = found or matches > 0
+            if output:
+                print('\n'.join(output))
+    except BrokenPipeError:
+        # Output piped to a command that stopped reading (head, ...)
+        sys.stderr.close()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if failed:
+        return 2
+    return 0 if found else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
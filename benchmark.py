@@ -0,0 +1,436 @@
+#############################################################################
+# Benchmark of the pattern matchers in this repository.
+#
+# Every engine is run on synthetic workloads that vary one parameter at a
+# time around a baseline: number of patterns, pattern length, wildcard
+# density, text size and hit density. For each run the build time, scan
+# time and throughput, peak memory and matches per second are recorded.
+#
+# Engines:
+#   AhoCorasick          - AhoCorasick.AhoCorasick
+#   AhoCorasick_v2       - AhoCorasick_v2.AhoCorasick
+#   AhoCorasick_v2/dfa   - AhoCorasick_v2.AhoCorasick(compiled=True)
+#   AhoCorasick_v2/sparse - AhoCorasick_v2.AhoCorasick(storage='sparse')
+#   Carsen_AC            - Carsen_AC.KeywordTrie
+#   ShiftOr              - ShiftOr.ShiftOr, all the patterns in one bit-parallel scan
+#   MatchPlanner         - MatchPlanner.MatchPlanner, the backend chosen per pattern group
+#   WildcardMatching     - WildcardMatching.findWildcardMatch, per pattern
+#   regex                - a single regex alternation of all the patterns
+#
+# Usage:
+#   python benchmark.py --suite quick --output results.json
+#   python benchmark.py --suite full --engines AhoCorasick_v2,regex
+#
+# The results are written as JSON so that runs of different versions can
+# be compared.
+#############################################################################
+
+import argparse
+import contextlib
+import importlib.machinery
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import regex
+
+import AhoCorasick
+import AhoCorasick_v2
+import MatchPlanner
+import ShiftOr
+import WildcardMatching
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Alphabet of the synthetic texts and patterns
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+# Output sink for the engines that print while they search.
+# It only counts the lines starting with prefix.
+class _CountingWriter:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.count = 0
+
+    def write(self, text):
+        if text.startswith(self.prefix):
+            self.count += 1
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def _quiet():
+    return contextlib.redirect_stdout(_CountingWriter(''))
+
+
+# Carsen_AC has no .py extension
+def _load_carsen():
+    path = os.path.join(DIRECTORY, 'Carsen_AC')
+    loader = importlib.machinery.SourceFileLoader('Carsen_AC', path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader('Carsen_AC', loader))
+    loader.exec_module(module)
+    return module
+
+
+#############################################################################
+# ENGINES
+# Each engine has a build function (patterns -> matcher), a scan function
+# (matcher, text -> number of matches), whether it understands wildcards,
+# and the largest number of patterns / text size it is run with (the slow
+# engines would otherwise take hours on the big workloads).
+#############################################################################
+
+def _build_v1(patterns):
+    with _quiet():
+        return AhoCorasick.AhoCorasick(list(patterns))
+
+
+def _scan_v1(matcher, text):
+    # search_words prints a line for every character
+    with _quiet():
+        result = matcher.search_words(text)
+    return sum(len(starts) for starts in result.values())
+
+
+def _build_v2(patterns):
+    return AhoCorasick_v2.AhoCorasick(list(patterns))
+
+
+def _build_v2_compiled(patterns):
+    return AhoCorasick_v2.AhoCorasick(list(patterns), compiled=True)
+
+
+def _build_v2_sparse(patterns):
+    return AhoCorasick_v2.AhoCorasick(list(patterns), storage='sparse')
+
+
+def _scan_v2(matcher, text):
+    return sum(len(starts) for starts in matcher.search_words(text).values())
+
+
+def _build_carsen(patterns):
+    return _load_carsen().KeywordTrie(list(patterns))
+
+
+def _scan_carsen(matcher, text):
+    return len(matcher.get_keywords_found(text))
+
+
+def _build_shift_or(patterns):
+    return ShiftOr.ShiftOr(list(patterns))
+
+
+def _build_planner(patterns):
+    return MatchPlanner.MatchPlanner(list(patterns))
+
+
+def _build_wildcard_matching(patterns):
+    return list(patterns)
+
+
+def _scan_wildcard_matching(patterns, text):
+    # findWildcardMatch prints one line per match
+    writer = _CountingWriter('String match')
+    with contextlib.redirect_stdout(writer):
+        for pattern in patterns:
+            WildcardMatching.findWildcardMatch(text, pattern)
+    return writer.count
+
+
+def _build_regex(patterns):
+    # Longest alternatives first, so the longest pattern wins at a position
+    alternatives = sorted({regex.escape(pattern).replace(r'\*', '.') for pattern in patterns},
+                          key=len, reverse=True)
+    return regex.compile('|'.join(alternatives), regex.IGNORECASE)
+
+
+def _scan_regex(compiled, text):
+    # Note that an alternation reports at most one pattern per start position
+    return sum(1 for _ in compiled.finditer(text, overlapped=True))
+
+
+ENGINES = {
+    'AhoCorasick': {'build': _build_v1, 'scan': _scan_v1, 'wildcards': True,
+                    'max_patterns': 1000, 'max_text': 1 << 20},
+    'AhoCorasick_v2': {'build': _build_v2, 'scan': _scan_v2, 'wildcards': True,
+                       'max_patterns': None, 'max_text': None},
+    'AhoCorasick_v2/dfa': {'build': _build_v2_compiled, 'scan': _scan_v2, 'wildcards': True,
+                           'max_patterns': None, 'max_text': None},
+    'AhoCorasick_v2/sparse': {'build': _build_v2_sparse, 'scan': _scan_v2, 'wildcards': True,
+                              'max_patterns': None, 'max_text': None},
+    'Carsen_AC': {'build': _build_carsen, 'scan': _scan_carsen, 'wildcards': False,
+                  'max_patterns': 100000, 'max_text': None},
+    'ShiftOr': {'build': _build_shift_or, 'scan': _scan_v2, 'wildcards': True,
+                'max_patterns': 10000, 'max_text': None},
+    'MatchPlanner': {'build': _build_planner, 'scan': _scan_v2, 'wildcards': True,
+                     'max_patterns': None, 'max_text': None},
+    'WildcardMatching': {'build': _build_wildcard_matching, 'scan': _scan_wildcard_matching,
+                         'wildcards': True, 'max_patterns': 100, 'max_text': None},
+    'regex': {'build': _build_regex, 'scan': _scan_regex, 'wildcards': True,
+              'max_patterns': 100000, 'max_text': None},
+}
+
+
+#############################################################################
+# WORKLOADS
+# kind is 'random' (random letters, patterns planted until hit_density of
+# the text is covered) or 'zipf' (words drawn from a Zipf-distributed
+# vocabulary, like natural language; patterns are vocabulary words, so
+# the hit density follows from the distribution).
+#############################################################################
+
+BASELINE = {'kind': 'random', 'patterns': 1000, 'min_length': 4, 'max_length': 10,
+            'wildcard_density': 0.0, 'text_size': 1 << 20, 'hit_density': 0.01}
+
+# Parameters varied one at a time around BASELINE
+SUITES = {
+    'quick': {
+        'patterns': [10, 100, 1000],
+        'lengths': [(2, 4), (8, 16)],
+        'wildcard_density': [0.1, 0.5],
+        'text_size': [1 << 16],
+        'hit_density': [0.0, 0.1],
+        'kind': ['zipf'],
+        'baseline': {'text_size': 1 << 17, 'patterns': 100},
+    },
+    'full': {
+        'patterns': [10, 100, 1000, 10000, 100000, 1000000],
+        'lengths': [(2, 4), (4, 10), (10, 30), (30, 100)],
+        'wildcard_density': [0.01, 0.1, 0.5, 1.0],
+        'text_size': [1 << 16, 1 << 20, 1 << 24],
+        'hit_density': [0.0, 0.001, 0.1, 0.5],
+        'kind': ['zipf'],
+        'baseline': {},
+    },
+}
+
+
+# Returns the workloads of a suite (dicts of parameters)
+def suite_workloads(name):
+    suite = SUITES[name]
+    baseline = dict(BASELINE, **suite['baseline'])
+    workloads = [baseline]
+    for count in suite['patterns']:
+        workloads.append(dict(baseline, patterns=count))
+    for min_length, max_length in suite['lengths']:
+        workloads.append(dict(baseline, min_length=min_length, max_length=max_length))
+    for density in suite['wildcard_density']:
+        workloads.append(dict(baseline, wildcard_density=density))
+    for size in suite['text_size']:
+        workloads.append(dict(baseline, text_size=size))
+    for density in suite['hit_density']:
+        workloads.append(dict(baseline, hit_density=density))
+    for kind in suite['kind']:
+        workloads.append(dict(baseline, kind=kind))
+
+    unique = []
+    for workload in workloads:
+        if workload not in unique:
+            unique.append(workload)
+    return unique
+
+
+def _random_word(rng, min_length, max_length):
+    return ''.join(rng.choices(LETTERS, k=rng.randint(min_length, max_length)))
+
+
+# Replaces one or two characters of a pattern with wildcards
+def _add_wildcards(rng, pattern):
+    characters = list(pattern)
+    for _ in range(rng.randint(1, min(2, len(characters)))):
+        characters[rng.randrange(len(characters))] = '*'
+    return ''.join(characters)
+
+
+# Fills in the wildcards of a pattern with random letters
+def _instantiate(rng, pattern):
+    return ''.join(rng.choice(LETTERS) if character == '*' else character for character in pattern)
+
+
+# Returns (patterns, text) for a workload
+def generate(workload, seed):
+    rng = random.Random(seed)
+    count = workload['patterns']
+    min_length = workload['min_length']
+    max_length = workload['max_length']
+    size = workload['text_size']
+
+    if workload['kind'] == 'zipf':
+        vocabulary = [_random_word(rng, 1, 12) for _ in range(max(count * 4, 1000))]
+        cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        # Patterns are vocabulary words of the right length, topped up
+        # with random words if there are not enough of them
+        candidates = sorted({word for word in vocabulary if min_length <= len(word) <= max_length})
+        patterns = rng.sample(candidates, k=min(count, len(candidates)))
+        patterns += [_random_word(rng, min_length, max_length) for _ in range(count - len(patterns))]
+
+        words = []
+        length = 0
+        while length < size:
+            for word in rng.choices(vocabulary, cum_weights=cumulative, k=4096):
+                words.append(word.capitalize() if rng.random() < 0.05 else word)
+                length += len(word) + 1
+        text = ' '.join(words)[:size]
+    else:
+        patterns = [_random_word(rng, min_length, max_length) for _ in range(count)]
+        pieces = []
+        length = 0
+        planted = 0
+        while length < size:
+            # Plant a pattern until hit_density of the text is covered
+            if patterns and planted < workload['hit_density'] * length:
+                piece = _instantiate(rng, rng.choice(patterns))
+                planted += len(piece)
+            else:
+                piece = ''.join(rng.choices(LETTERS + ' ', k=64))
+            pieces.append(piece)
+            length += len(piece)
+        text = ''.join(pieces)[:size]
+
+    patterns = [_add_wildcards(rng, pattern) if rng.random() < workload['wildcard_density'] else pattern
+                for pattern in patterns]
+    return patterns, text
+
+
+#############################################################################
+# RUNNING
+#############################################################################
+
+# Returns the reason an engine is not run on a workload, or None
+def _skip_reason(engine, workload, patterns):
+    if engine['max_patterns'] is not None and workload['patterns'] > engine['max_patterns']:
+        return 'more than {count} patterns'.format(count=engine['max_patterns'])
+    if engine['max_text'] is not None and workload['text_size'] > engine['max_text']:
+        return 'text larger than {size} characters'.format(size=engine['max_text'])
+    if not engine['wildcards'] and any('*' in pattern for pattern in patterns):
+        return 'no wildcard support'
+    return None
+
+
+# Runs one engine on one workload and returns its result record
+def run(name, workload, patterns, text, repeat=1, memory=True):
+    engine = ENGINES[name]
+    record = {'engine': name, 'workload': workload}
+    reason = _skip_reason(engine, workload, patterns)
+    if reason:
+        record['skipped'] = reason
+        return record
+
+    try:
+        # Best of repeat runs
+        build_seconds = scan_seconds = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            matcher = engine['build'](patterns)
+            build_seconds = min(build_seconds, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            matches = engine['scan'](matcher, text)
+            scan_seconds = min(scan_seconds, time.perf_counter() - start)
+            del matcher
+
+        # Peak memory is measured in a separate run, tracing slows it down
+        if memory:
+            tracemalloc.start()
+            engine['scan'](engine['build'](patterns), text)
+            record['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    except Exception as error:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        record['error'] = repr(error)
+        return record
+
+    megabytes = len(text.encode('utf-8')) / 1e6
+    record.update({
+        'build_seconds': build_seconds,
+        'scan_seconds': scan_seconds,
+        'scan_mb_per_s': megabytes / scan_seconds if scan_seconds else None,
+        'matches': matches,
+        'matches_per_s': matches / scan_seconds if scan_seconds else None,
+    })
+    return record
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=DIRECTORY, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_record(record):
+    workload = record['workload']
+    label = '{kind} p={patterns} len={min_length}-{max_length} wild={wildcard_density} ' \
+            'text={text_size} hits={hit_density}'.format(**workload)
+    if 'skipped' in record or 'error' in record:
+        print('{engine:21} {label:70} {note}'.format(
+            engine=record['engine'], label=label, note=record.get('skipped') or record.get('error')))
+        return
+    print('{engine:21} {label:70} build {build:8.3f}s  scan {speed:8.3f} MB/s  '
+          '{matches:>9} matches  {memory}'.format(
+              engine=record['engine'], label=label, build=record['build_seconds'],
+              speed=record['scan_mb_per_s'] or 0, matches=record['matches'],
+              memory='{:.1f} MB'.format(record['peak_memory_bytes'] / 1e6)
+              if 'peak_memory_bytes' in record else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pattern matchers of this repository.')
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--engines', default=','.join(ENGINES),
+                        help='comma-separated engine names (default: all)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per measurement, the best is kept')
+    parser.add_argument('--seed', type=int, default=504)
+    parser.add_argument('--max-patterns', type=int, help='skip workloads with more patterns')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory')
+    args = parser.parse_args(argv)
+
+    engines = [name for name in args.engines.split(',') if name]
+    for name in engines:
+        if name not in ENGINES:
+            parser.error('unknown engine {name}'.format(name=name))
+
+    results = []
+    for workload in suite_workloads(args.suite):
+        if args.max_patterns is not None and workload['patterns'] > args.max_patterns:
+            continue
+        patterns, text = generate(workload, args.seed)
+        for name in engines:
+            record = run(name, workload, patterns, text, repeat=args.repeat, memory=not args.no_memory)
+            _print_record(record)
+            results.append(record)
+
+    report = {
+        'meta': {
+            'suite': args.suite,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,9 +4,21 @@
 # This trie was sourced from: 
 # https://albertauyeung.github.io/2020/06/15/python-trie.html/
 
+# Used by the compact file format of Trie.save / MappedTrie
+import heapq
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+
 class TrieNode:
     """A node in the trie structure"""
 
+    # No __dict__ per node, which matters for large dictionaries
+    __slots__ = ('char', 'is_end', 'counter', 'children', 'top')
+
     def __init__(self, char):
         # the character stored in this node
         self.char = char
@@ -22,20 +34,132 @@ class TrieNode:
         # keys are characters, values are nodes
         self.children = {}
 
+        # the (word, counter) pairs of the most inserted words below
+        # this node, most inserted first (see Trie.query_top_k), made
+        # on first use so a trie without top_k lists pays nothing
+        self.top = None
+
         
 class Trie(object):
     """The trie object"""
 
-    def __init__(self):
+    def __init__(self, top_k=0):
         """
         The trie has at least the root node.
         The root node does not store any character
+
+        Args:
+            - top_k: number of most inserted words kept at every
+                node for query_top_k (0, the default, to keep none:
+                the lists cost memory and insert time at every node)
         """
         self.root = TrieNode("")
-    
+        self.top_k = top_k
+
+        # whether nodes are shared (see from_sorted), then the
+        # trie can no longer be changed
+        self.minimized = False
+
+    @classmethod
+    def from_sorted(cls, words, top_k=0, minimize=False):
+        """Build a trie from words given in sorted order, in one pass
+
+        Each word only adds the nodes after the prefix it shares with
+        the previous word, and the nodes of the previous word below
+        that prefix are complete from then on.
+
+        Args:
+            - words: an iterable of words in sorted order, a word
+                repeated n times is counted as inserted n times
+            - top_k: as for Trie()
+            - minimize: share equal subtrees, which turns the trie
+                into a minimal DAWG (directed acyclic word graph).
+                The words sharing a suffix then share its nodes, so the
+                trie cannot be changed afterwards and keeps no top_k
+                lists (query_top_k falls back to query).
+        """
+        trie = cls(top_k=0 if minimize else top_k)
+        register = {} if minimize else None
+
+        # The path of the previous word, from the root
+        path = [trie.root]
+        previous = None
+        for word in words:
+            common = 0
+            if previous is not None:
+                if word < previous:
+                    raise ValueError("words are not sorted: {word!r} comes after {previous!r}".format(
+                        word=word, previous=previous))
+                limit = min(len(word), len(previous))
+                while common < limit and word[common] == previous[common]:
+                    common += 1
+                trie._complete(path, common, previous, register)
+
+            node = path[-1]
+            for char in word[common:]:
+                new_node = TrieNode(char)
+                node.children[char] = new_node
+                node = new_node
+                path.append(node)
+            node.is_end = True
+            node.counter += 1
+            previous = word
+
+        if previous is not None:
+            trie._complete(path, 0, previous, register)
+            trie._complete_node(trie.root, previous[:0])
+        trie.minimized = minimize
+        return trie
+
+    @classmethod
+    def from_file(cls, path, top_k=0, minimize=False, encoding="utf-8"):
+        """Build a trie from a file of sorted words, one per line
+        (see from_sorted)"""
+        with open(path, encoding=encoding) as file:
+            return cls.from_sorted((line.rstrip("\n") for line in file), top_k=top_k, minimize=minimize)
+
+    def _complete(self, path, depth, word, register):
+        """Complete the nodes of path deeper than depth, path being
+        the nodes of word, and share them if minimizing
+
+        A node is complete once the words are past its subtree,
+        its children are complete before it.
+        """
+        if register is None and not self.top_k:
+            # Nothing to do with complete nodes
+            del path[depth + 1:]
+            return
+
+        while len(path) > depth + 1:
+            node = path.pop()
+            self._complete_node(node, word[:len(path)])
+            if register is None:
+                continue
+
+            # Nodes with the same character, counter and (already
+            # shared) children have equal subtrees, keep only one
+            key = (node.char, node.counter, tuple((char, id(child)) for char, child in node.children.items()))
+            existing = register.setdefault(key, node)
+            if existing is not node:
+                path[-1].children[node.char] = existing
+
+    def _complete_node(self, node, word):
+        """Fill the top list of a complete node from the lists of its
+        children, word being the path to the node"""
+        if not self.top_k:
+            return
+        top = [(word, node.counter)] if node.is_end else []
+        for child in node.children.values():
+            top.extend(child.top or ())
+        top.sort(key=lambda x: x[1], reverse=True)
+        node.top = top[:self.top_k]
+
     def insert(self, word):
         """Insert a word into the trie"""
+        if self.minimized:
+            raise ValueError("a minimized trie cannot be changed")
         node = self.root
+        path = [node]
         
         # Loop through each character in the word
         # Check if there is no child containing the character, create a new child for the current node
@@ -48,12 +172,22 @@ class Trie(object):
                 new_node = TrieNode(char)
                 node.children[char] = new_node
                 node = new_node
+            path.append(node)
         
         # Mark the end of a word
         node.is_end = True
 
         # Increment the counter to indicate that we see this word once more
         node.counter += 1
+
+        # The word may now be among the most inserted below each
+        # node of its path
+        if self.top_k:
+            counter = node.counter
+            for node in path:
+                if node.top is None:
+                    node.top = []
+                _update_top(node.top, word, counter, self.top_k)
         
     def dfs(self, node, prefix):
         """Depth-first traversal of the trie
@@ -91,4 +225,369 @@ class Trie(object):
         self.dfs(node, x[:-1])
 
         # Sort the results in reverse order and return
-        return sorted(self.output, key=lambda x: x[1], reverse=True)
\ No newline at end of file
+        return sorted(self.output, key=lambda x: x[1], reverse=True)
+
+    def query_top_k(self, x, k):
+        """Given an input (a prefix), retrieve the k words with that
+        prefix that have been inserted the most times, most inserted first
+
+        The top_k best words of every node are kept up to date by insert,
+        so this only walks the prefix. For k larger than top_k it falls
+        back to query.
+        """
+        if k > self.top_k:
+            return self.query(x)[:k]
+
+        node = self.root
+        for char in x:
+            if char in node.children:
+                node = node.children[char]
+            else:
+                return []
+        return node.top[:k] if node.top else []
+
+    def save(self, path):
+        """Write the trie to path in the compact format read by MappedTrie
+
+        The file starts with a header (see _TRIE_HEADER) followed by
+        native 32-bit integer arrays: for each node the index of its
+        first edge (plus one past the last), its counter (0 if no word
+        ends there) and the highest counter below it, then for each
+        edge its character and target node. The edges of a node are
+        sorted by character. Nodes shared by a minimized trie are
+        written once.
+        """
+        ids = {id(self.root): 0}
+        nodes = [self.root]
+        edge_start = array('i', [0])
+        edge_char = array('i')
+        edge_target = array('i')
+        counter = array('i')
+
+        # Number the nodes breadth first
+        i = 0
+        while i < len(nodes):
+            node = nodes[i]
+            i += 1
+            counter.append(node.counter if node.is_end else 0)
+            for char in sorted(node.children):
+                child = node.children[char]
+                if id(child) not in ids:
+                    ids[id(child)] = len(nodes)
+                    nodes.append(child)
+                edge_char.append(ord(char))
+                edge_target.append(ids[id(child)])
+            edge_start.append(len(edge_char))
+
+        # The highest counter below each node, children first
+        best = array('i', [-1]) * len(nodes)
+        stack = [0]
+        while stack:
+            n = stack[-1]
+            targets = edge_target[edge_start[n]:edge_start[n + 1]]
+            waiting = [t for t in targets if best[t] == -1]
+            if waiting:
+                stack.extend(waiting)
+                continue
+            stack.pop()
+            best[n] = max([counter[n]] + [best[t] for t in targets])
+
+        with open(path, 'wb') as file:
+            file.write(_TRIE_HEADER.pack(_TRIE_MAGIC, sys.byteorder[0].encode(), len(nodes), len(edge_char)))
+            for table in (edge_start, counter, best, edge_char, edge_target):
+                file.write(table)
+
+    @staticmethod
+    def load(path, use_mmap=True):
+        """Read a trie written by save, see MappedTrie"""
+        return MappedTrie(path, use_mmap)
+
+
+class MappedTrie(object):
+    """A read-only trie read from a file written by Trie.save
+
+    With use_mmap the file is memory-mapped and the tables are
+    read-only views into it, so loading costs no time and memory
+    whatever the size of the trie, and processes loading the same file
+    share it. query returns the same words as Trie.query (ties in
+    alphabetical order), query_top_k is a best-first search guided by
+    the highest counter below each node, so it costs about k paths.
+    """
+
+    def __init__(self, path, use_mmap=True):
+        with open(path, 'rb') as file:
+            if use_mmap:
+                data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                data = memoryview(file.read())
+
+        magic, byteorder, nodes, edges = _TRIE_HEADER.unpack_from(data)
+        if magic != _TRIE_MAGIC:
+            raise ValueError("{path} is not a saved trie".format(path=path))
+        if byteorder != sys.byteorder[0].encode():
+            raise ValueError("{path} was saved on a machine with a different byte order".format(path=path))
+
+        position = _TRIE_HEADER.size
+        for name, size in (('edge_start', nodes + 1), ('counter', nodes), ('best', nodes),
+                           ('edge_char', edges), ('edge_target', edges)):
+            table = data[position:position + 4 * size].cast('i')
+            setattr(self, name, table if use_mmap else array('i', table))
+            position += 4 * size
+
+    def find(self, prefix):
+        """Return the node of prefix, or -1 if no word starts with it"""
+        node = 0
+        edge_start = self.edge_start
+        edge_char = self.edge_char
+        for char in prefix:
+            start, end = edge_start[node], edge_start[node + 1]
+            edge = bisect_left(edge_char, ord(char), start, end)
+            if edge == end or edge_char[edge] != ord(char):
+                return -1
+            node = self.edge_target[edge]
+        return node
+
+    def query(self, x):
+        """Given an input (a prefix), retrieve all words stored in
+        the trie with that prefix, sort the words by the number of
+        times they have been inserted
+        """
+        node = self.find(x)
+        if node == -1:
+            return []
+
+        output = []
+        stack = [(node, x)]
+        while stack:
+            node, word = stack.pop()
+            if self.counter[node]:
+                output.append((word, self.counter[node]))
+            for edge in reversed(range(self.edge_start[node], self.edge_start[node + 1])):
+                stack.append((self.edge_target[edge], word + chr(self.edge_char[edge])))
+        return sorted(output, key=lambda x: x[1], reverse=True)
+
+    def query_top_k(self, x, k):
+        """Given an input (a prefix), retrieve the k words with that
+        prefix that have been inserted the most times, most inserted first
+        """
+        node = self.find(x)
+        if node == -1:
+            return []
+
+        # The heap holds words found (kind 0) and subtrees still to be
+        # explored (kind 1), by counter or highest counter below. A word
+        # comes out of it before anything that could beat it.
+        output = []
+        order = 0
+        heap = [(-self.best[node], 1, order, node, x)]
+        while heap and len(output) < k:
+            _, kind, _, node, word = heapq.heappop(heap)
+            if kind == 0:
+                output.append((word, self.counter[node]))
+                continue
+            if self.counter[node]:
+                order += 1
+                heapq.heappush(heap, (-self.counter[node], 0, order, node, word))
+            for edge in range(self.edge_start[node], self.edge_start[node + 1]):
+                target = self.edge_target[edge]
+                order += 1
+                heapq.heappush(heap, (-self.best[target], 1, order, target, word + chr(self.edge_char[edge])))
+        return output
+
+
+# Header of a saved trie: magic, byte order, number of nodes and of edges
+_TRIE_MAGIC = b'TRv1'
+_TRIE_HEADER = struct.Struct('=4sc2i')
+
+
+class RadixNode:
+    """A node in the radix trie structure
+
+    The label of the edge leading to a node is the span
+    source[start:end] of a word inserted earlier, so no substring is
+    stored. The whole path from the root to the node is always
+    source[:end], and the path to its parent source[:start].
+    """
+
+    __slots__ = ('source', 'start', 'end', 'is_end', 'counter', 'children', 'top')
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+
+        # whether this can be the end of a word
+        self.is_end = False
+
+        # a counter indicating how many times a word is inserted
+        # (if this node's is_end is True)
+        self.counter = 0
+
+        # a dictionary of child nodes, keyed by the first character
+        # of their label, or None for a leaf
+        self.children = None
+
+        # the (word, counter) pairs of the most inserted words below
+        # this node, most inserted first (see Trie.query_top_k), made
+        # on first use so a trie without top_k lists pays nothing
+        self.top = None
+
+
+class RadixTrie(object):
+    """The compressed (radix) trie object
+
+    Same interface as Trie, but chains of nodes with a single child are
+    merged into one node whose edge is labelled by a span of a word, so
+    there is one node per word or branch instead of one per character.
+    Insertions and queries are iterative, so long words do not hit the
+    recursion limit. Queries keep their state in local variables and can
+    run in several threads at once (but not at the same time as insert).
+    """
+
+    def __init__(self, top_k=0):
+        """
+        The trie has at least the root node.
+        The root node has an empty label
+
+        Args:
+            - top_k: number of most inserted words kept at every
+                node for query_top_k (0, the default, to keep none:
+                the lists cost memory and insert time at every node)
+        """
+        self.root = RadixNode("", 0, 0)
+        self.top_k = top_k
+
+    def insert(self, word):
+        """Insert a word into the trie"""
+        node = self.root
+        path = [node]
+        i = 0
+
+        while i < len(word):
+            child = node.children.get(word[i]) if node.children else None
+            if child is None:
+                # No edge starts with the next character, the rest
+                # of the word is the label of a new leaf
+                child = RadixNode(word, i, len(word))
+                if node.children is None:
+                    node.children = {}
+                node.children[word[i]] = child
+                node = child
+                path.append(node)
+                break
+
+            # Follow the label as long as it matches the word
+            source, start, end = child.source, child.start, child.end
+            j = 1
+            while start + j < end and i + j < len(word) and source[start + j] == word[i + j]:
+                j += 1
+
+            if start + j < end:
+                # The word leaves the label after j characters: split the
+                # edge with a new node at that point
+                middle = RadixNode(source, start, start + j)
+                middle.children = {source[start + j]: child}
+                if child.top is not None:
+                    middle.top = list(child.top)
+                child.start = start + j
+                node.children[word[i]] = middle
+                child = middle
+
+            node = child
+            path.append(node)
+            i += j
+
+        # Mark the end of a word
+        node.is_end = True
+
+        # Increment the counter to indicate that we see this word once more
+        node.counter += 1
+
+        # The word may now be among the most inserted below each
+        # node of its path
+        if self.top_k:
+            counter = node.counter
+            for node in path:
+                if node.top is None:
+                    node.top = []
+                _update_top(node.top, word, counter, self.top_k)
+
+    def find(self, prefix):
+        """Return the highest node whose path starts with prefix,
+        or None if no word starts with prefix"""
+        node = self.root
+        i = 0
+        while i < len(prefix):
+            node = node.children.get(prefix[i]) if node.children else None
+            if node is None:
+                return None
+
+            # Compare the rest of the label with the rest of the prefix
+            source, start, end = node.source, node.start, node.end
+            length = min(end - start, len(prefix) - i)
+            for j in range(1, length):
+                if source[start + j] != prefix[i + j]:
+                    return None
+            i += length
+        return node
+
+    def query(self, x):
+        """Given an input (a prefix), retrieve all words stored in
+        the trie with that prefix, sort the words by the number of
+        times they have been inserted
+        """
+        node = self.find(x)
+        if node is None:
+            return []
+
+        # Traverse the subtree with an explicit stack, in the same order
+        # as Trie.dfs. The word of a node is a slice of its source, so no
+        # prefix is built along the way.
+        output = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.is_end:
+                output.append((node.source[:node.end], node.counter))
+            if node.children:
+                stack.extend(reversed(node.children.values()))
+
+        # Sort the results in reverse order and return
+        return sorted(output, key=lambda x: x[1], reverse=True)
+
+    def query_top_k(self, x, k):
+        """Given an input (a prefix), retrieve the k words with that
+        prefix that have been inserted the most times, most inserted first
+        (see Trie.query_top_k)
+        """
+        if k > self.top_k:
+            return self.query(x)[:k]
+
+        node = self.find(x)
+        if node is None:
+            return []
+        return node.top[:k] if node.top else []
+
+
+def _update_top(top, word, counter, k):
+    """Record that word has now been inserted counter times in
+    the top list of a node, keeping its k most inserted words
+
+    Counters only grow, so a word that is not in the list can only
+    enter it by passing its last word.
+    """
+    for i, (other, _) in enumerate(top):
+        if other == word:
+            del top[i]
+            break
+    else:
+        if len(top) >= k:
+            if top[-1][1] >= counter:
+                return
+            top.pop()
+
+    # Insert after the words inserted as many times
+    i = len(top)
+    while i > 0 and top[i - 1][1] < counter:
+        i -= 1
+    top.insert(i, (word, counter))